@@ -1,163 +1,314 @@
 import os
 import json
 import pandas as pd
-import datetime as dt
+import numpy as np
 import math
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor
 
 months_dict = {
     "janeiro": 1, "fevereiro": 2, "março": 3, "abril": 4, "maio": 5, "junho": 6, "julho": 7, "agosto": 8, "setembro": 9,
     "outubro": 10, "novembro": 11, "dezembro": 12
 }
 
-if __name__ == "__main__":
-    abs_path = os.path.abspath(os.curdir) + '\\data-processing\\data\\2020-05-31 23_04_05 - Funds Data.csv'
-    funds_df_raw = pd.read_csv(abs_path, quotechar='"')
-    
-    proc_data = {
-        "Ticker": [], "Nome": [], "Administrador": [], "Descrição": [], "Data de Constituição do Fundo": [], "Cotas Emitidas": [],
-        "Tipo de Gestão": [],  "Público Alvo": [], "Mandato": [], "Segmento": [], "Prazo de Duração": [], "Taxa de Administração": [],
-        "Taxa de Performance": [], "Ativos Atuais": [], "Liquidez Diária": [], "Patrimônio Líquido": [], "Cotações Históricas": [],
-        "Dividendos Históricos": [], "Dividend Yield Histórico": [], "Valor Patrimonial Histórico": [], "Vacância Histórica": []
+new_columns = [
+    "Ticker", "Nome", "Administrador", "Descrição", "Data de Constituição do Fundo", "Cotas Emitidas", "Tipo de Gestão", "Público Alvo",
+    "Mandato", "Segmento", "Prazo de Duração", "Taxa de Administração", "Taxa de Performance", "Ativos Atuais", "Liquidez Diária",
+    "Patrimônio Líquido", "Cotações Históricas", "Dividendos Históricos", "Dividend Yield Histórico", "Valor Patrimonial Histórico",
+    "Vacância Histórica"
+]
+
+text_columns = ["Ticker", "Nome", "Administrador", "Descrição"]
+series_columns = ["Dividendos Históricos", "Dividend Yield Histórico", "Valor Patrimonial Histórico"]
+empty_cells = ["[]", "[[], []]", "{}"]
+
+# processed dataset files: scalar columns in a parquet file, histories as contiguous arrays sliced by per-fund offsets
+series_files = {
+    "Cotações Históricas": "prices", "Dividendos Históricos": "dividends", "Dividend Yield Histórico": "yields",
+    "Valor Patrimonial Histórico": "equity"
+}
+vacancy_columns = ["Ocupação Física", "Vacância Física", "Ocupação Financeira", "Vacância Financeira"]
+
+# quotes inside the assets names break the json once single quotes are swapped, only the first match of a cell is fixed
+assets_quote_fixes = [("D'Ávila", "D Ávila"), ("D'ouro", "D ouro"), ("d'Oeste", "D Oeste"), ("SAM'S", "SAMS"), ('"F"', "F")]
+
+def to_datetime(date):
+    return date.to_pydatetime()
+
+def load_parquet(folder):
+    # tables written by the scraper with --parquet, the histories come out already typed in the same shape the csv cells are parsed into
+    funds = pd.read_parquet(os.path.join(folder, "funds.parquet"))
+    funds["Principais Indicadores"] = funds["Principais Indicadores"].apply(dict)
+    funds["Informações Básicas"] = funds["Informações Básicas"].apply(dict)
+
+    def by_ticker(name):
+        table = pd.read_parquet(os.path.join(folder, name + ".parquet"))
+        return {ticker: rows for ticker, rows in table.groupby("Ticker", sort=False)}
+
+    prices = by_ticker("prices")
+    funds["Cotações Históricas"] = [
+        [[to_datetime(date) for date in prices[ticker]["Data"]], prices[ticker]["Cotação"].tolist()] if ticker in prices else None
+        for ticker in funds["Ticker"]
+    ]
+
+    for key, name, column in [("Dividendos Históricos", "dividends", "Dividendo"), ("Dividend Yield Histórico", "yields", "Dividend Yield"),
+                              ("Valor Patrimonial Histórico", "equity", "Valor Patrimonial")]:
+        history = by_ticker(name)
+        funds[key] = [
+            [[to_datetime(date) for date in history[ticker]["Data"]], history[ticker][column].tolist()] if ticker in history else None
+            for ticker in funds["Ticker"]
+        ]
+
+    vacancy = by_ticker("vacancy")
+    funds["Vacância Histórica"] = [
+        dict({"date": [to_datetime(date) for date in vacancy[ticker]["Data"]]},
+             **{column: vacancy[ticker][column].tolist() for column in vacancy[ticker].columns if column not in ["Ticker", "Data"]})
+        if ticker in vacancy else None
+        for ticker in funds["Ticker"]
+    ]
+
+    assets = by_ticker("assets")
+    asset_items = by_ticker("asset_items")
+    funds["Ativos Atuais"] = [
+        {
+            "Assets": {
+                asset: dict(zip(items["Informação"], items["Valor"]))
+                for asset, items in (asset_items[ticker].groupby("Ativo", sort=False) if ticker in asset_items else [])
+            },
+            "Location": [assets[ticker]["UF"].tolist(), assets[ticker]["Área"].tolist()] if ticker in assets else [[], []]
+        }
+        if ticker in assets or ticker in asset_items else None
+        for ticker in funds["Ticker"]
+    ]
+
+    return funds
+
+def is_text(column):
+    # cells still holding the scraped text, typed cells from the parquet tables are left untouched
+    return column.map(lambda cell: isinstance(cell, str)).astype(bool)
+
+def parse_json_cells(cells):
+    # the python reprs written by the scraper as json, all the cells of a column parsed in a single call
+    if len(cells) == 0:
+        return []
+    return json.loads("[" + ",".join(cells.str.replace("\'", '\"', regex=False)) + "]")
+
+def parse_month_dates(dates):
+    # "Maio/2020" labels to the first day of the month
+    # the same few hundred labels repeat across every fund, so only the distinct ones are parsed
+    if len(dates) == 0:
+        return []
+    codes, labels = pd.factorize(np.array(dates, dtype=object))
+    splitted = pd.Series(labels, dtype=object).str.split("/")
+    months = splitted.str[0].str.lower().map(months_dict)
+    if months.isna().any():
+        raise KeyError(f'Unknown months { sorted(set(splitted.str[0][months.isna()])) }')
+
+    elapsed = (splitted.str[1].astype(int) - 1970)*12 + months.astype(int) - 1
+    return elapsed.to_numpy().astype("datetime64[M]").astype("datetime64[us]").astype(object)[codes].tolist()
+
+def parse_timestamps(dates):
+    if len(dates) == 0:
+        return []
+    return pd.to_datetime(pd.Series(dates, dtype=object), format="%Y-%m-%d %H:%M:%S").to_numpy().astype("datetime64[us]").tolist()
+
+def split_by_lengths(values, lengths):
+    offsets = np.cumsum([0] + lengths)
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+def as_cells(values, keep):
+    # values where keep holds and None elsewhere, as appended by the original cell loop
+    return [value if kept else None for value, kept in zip(values, keep)]
+
+def process_text(column, key):
+    if key == "Descrição":
+        return column.astype(object).tolist()
+    return as_cells(column, ~column.astype(object).map(str).str.contains("N/A|nan", regex=True))
+
+def process_history(column, key):
+    cells = column.astype(object).tolist()
+    text = is_text(column)
+    empty = text & column.where(text, "").isin(empty_cells)
+    parsed_index = column.index[text & ~empty]
+    raw = column[parsed_index]
+
+    if key == "Ativos Atuais":
+        fixed = pd.Series(False, index=raw.index)
+        for old, new in assets_quote_fixes:
+            matches = ~fixed & raw.str.contains(old, regex=False)
+            raw = raw.where(~matches, raw.str.replace(old, new, regex=False))
+            fixed = fixed | matches
+
+    parsed = parse_json_cells(raw)
+
+    if key in series_columns:
+        dates = parse_month_dates([date for obj in parsed for date in obj[0]])
+        for obj, obj_dates in zip(parsed, split_by_lengths(dates, [len(obj[0]) for obj in parsed])):
+            obj[0] = obj_dates
+
+    elif key == "Cotações Históricas":
+        lengths = [len(obj) for obj in parsed]
+        dates = split_by_lengths(parse_timestamps([line['data'] for obj in parsed for line in obj]), lengths)
+        prices = split_by_lengths(np.array([line['fec'] for obj in parsed for line in obj], dtype=float).tolist(), lengths)
+        parsed = [[obj_dates, obj_prices] for obj_dates, obj_prices in zip(dates, prices)]
+
+    elif key == "Vacância Histórica":
+        dates = parse_month_dates([date for obj in parsed for date in obj['date']])
+        for obj, obj_dates in zip(parsed, split_by_lengths(dates, [len(obj['date']) for obj in parsed])):
+            obj['date'] = obj_dates
+
+    for position, value in zip(column.index.get_indexer(parsed_index), parsed):
+        cells[position] = value
+    for position in column.index.get_indexer(column.index[empty]):
+        cells[position] = None
+    return cells
+
+def parse_dict_column(column):
+    # one column per key of the scraped dicts
+    text = is_text(column)
+    parsed = column.astype(object).tolist()
+    for position, value in zip(column.index.get_indexer(column.index[text]), parse_json_cells(column[text])):
+        parsed[position] = value
+    return pd.DataFrame.from_records(parsed, index=column.index)
+
+def process_indicators(column):
+    indicators = parse_dict_column(column)
+
+    liquidity = indicators["Liquidez Diária"]
+    liquidity_na = liquidity.str.contains("N/A", regex=False)
+    liquidity_values = liquidity.where(~liquidity_na, "0").str.replace(".", "", regex=False).astype(float)
+
+    net_worth = indicators["Patrimônio Líquido"].str.replace(",", ".", regex=False)
+    net_worth_na = net_worth.str.contains("N/A", regex=False)
+    multiplier = np.select(
+        [net_worth.str.contains("bi", regex=False), net_worth.str.contains("mi", regex=False)], [1e9, 1e6], default=1e3
+    )
+    net_worth_values = net_worth.where(~net_worth_na, "R$ 0").str.split(" ").str[1].astype(float)*multiplier
+
+    return {
+        "Liquidez Diária": as_cells(liquidity_values, ~liquidity_na & (liquidity_values > 0)),
+        "Patrimônio Líquido": as_cells(net_worth_values, ~net_worth_na)
+    }
+
+def process_basic_info(column):
+    basic_info = parse_dict_column(column)
+    not_available = {key: basic_info[key].str.contains("N/A", regex=False) for key in basic_info.columns}
+
+    fund_date = basic_info['DATA DA CONSTITUIÇÃO DO FUNDO'].where(~not_available['DATA DA CONSTITUIÇÃO DO FUNDO'], "1 de janeiro de 1970")
+    fund_date = fund_date.str.split(" de ")
+    fund_date_values = pd.to_datetime(pd.DataFrame({
+        "year": fund_date.str[2].astype(int), "month": fund_date.str[1].str.lower().map(months_dict), "day": fund_date.str[0].astype(int)
+    })).to_numpy().astype("datetime64[us]").tolist()
+
+    total_quotas = basic_info['COTAS EMITIDAS']
+    total_quotas_values = total_quotas.where(~not_available['COTAS EMITIDAS'], "0").str.replace(".", "", regex=False).astype(float)
+
+    processed = {
+        "Data de Constituição do Fundo": as_cells(fund_date_values, ~not_available['DATA DA CONSTITUIÇÃO DO FUNDO']),
+        "Cotas Emitidas": as_cells(total_quotas_values, ~not_available['COTAS EMITIDAS']),
+        "Prazo de Duração": basic_info['PRAZO DE DURAÇÃO'].astype(object).tolist()
     }
-    new_columns = proc_data.keys()
-
-    for key in funds_df_raw.keys():
-
-        for line in range(0,funds_df_raw.shape[0]):
-            if key in new_columns:
-                subset = funds_df_raw[key][line]
-                if key in ["Ativos Atuais", "Cotações Históricas", "Dividendos Históricos",  "Dividend Yield Histórico", "Valor Patrimonial Histórico", "Vacância Histórica"]:
-                    if subset in ["[]","[[], []]","{}"]:
-                        subset = None
-
-                    elif key in ["Dividendos Históricos", "Dividend Yield Histórico", "Valor Patrimonial Histórico"]:
-                        parsed_obj = json.loads(subset.replace("\'", '\"'))
-                        
-                        dates = parsed_obj[0]
-                        for index, date in enumerate(dates):
-                            splitted = date.split("/")
-                            parsed_date = dt.datetime(int(splitted[1]), months_dict[splitted[0].lower()], 1)
-                            parsed_obj[0][index] = parsed_date
-
-                        subset = parsed_obj
-                    
-                    elif key == "Cotações Históricas":
-                        parsed_obj = json.loads(subset.replace("\'", '\"'))
-
-                        data = [[], []]
-                        for line in parsed_obj:
-                            data[0].append(dt.datetime.strptime(line['data'], "%Y-%m-%d %H:%M:%S"))
-                            data[1].append(float(line['fec']))
-
-                        subset = data
-
-                    elif key == "Vacância Histórica":
-                        parsed_obj = json.loads(subset.replace("\'", '\"'))
-                        dates = parsed_obj['date']
-
-                        for index, date in enumerate(dates):
-                            splitted = date.split("/")
-                            parsed_date = dt.datetime(int(splitted[1]), months_dict[splitted[0].lower()], 1)
-                            parsed_obj['date'][index] = parsed_date
-
-                        subset = parsed_obj
-
-                    else:
-                        if "D'Ávila" in subset:
-                            subset = subset.replace("D'Ávila", "D Ávila")
-                        elif "D'ouro" in subset:
-                            subset = subset.replace("D'ouro", "D ouro")
-                        elif "d'Oeste" in subset:
-                            subset = subset.replace("d'Oeste", "D Oeste")
-                        elif "SAM'S" in subset:
-                            subset = subset.replace("SAM'S",  "SAMS")
-                        elif '"F"' in subset:
-                            subset = subset.replace('"F"', "F")
-                        subset = json.loads(subset.replace("\'", "\""))
-
-                elif ("N/A" in str(subset) or "nan" in str(subset)) and not key == "Descrição":
-                    subset = None
-                proc_data[key].append(subset)
-
-            else:
-                subset = json.loads(funds_df_raw[key][line].replace("\'", "\""))
-                if key == "Principais Indicadores":
-                    liquidity = subset["Liquidez Diária"]
-                    if "N/A" in liquidity:
-                        liquidity = None
-                    elif "." in liquidity:
-                        liquidity = float(liquidity.replace(".", ""))
-                        if liquidity <= 0: liquidity = None
-                    else:
-                        liquidity = float(liquidity)
-                        if liquidity <= 0: liquidity = None
-
-                    net_worth = subset["Patrimônio Líquido"]
-                    if "," in net_worth:
-                        net_worth = net_worth.replace(",", ".")
-                    if "N/A" in net_worth:
-                        net_worth = None
-                    elif "bi" in net_worth:
-                        net_worth = float(net_worth.split(" ")[1])*1e9
-                    elif "mi" in net_worth:
-                        net_worth = float(net_worth.split(" ")[1])*1e6
-                    else:
-                        net_worth = float(net_worth.split(" ")[1])*1e3
-
-                    proc_data["Liquidez Diária"].append(liquidity)
-                    proc_data["Patrimônio Líquido"].append(net_worth)
-
-                elif key == "Informações Básicas":
-                    fund_date = subset['DATA DA CONSTITUIÇÃO DO FUNDO']
-                    total_quotas = subset['COTAS EMITIDAS']
-                    mgmt_type = subset['TIPO DE GESTÃO']
-                    target = subset['PÚBLICO-ALVO']
-                    mandate = subset['MANDATO']
-                    segment = subset['SEGMENTO']
-                    term = subset['PRAZO DE DURAÇÃO']
-                    admin_tax = subset['TAXA DE ADMINISTRAÇÃO']
-                    perf_tax = subset['TAXA DE PERFORMANCE']
-
-                    if "N/A" in fund_date:
-                        fund_date = None
-                    else:
-                        fund_date = fund_date.split(" de ")
-                        fund_date = dt.datetime(int(fund_date[2]), months_dict[fund_date[1].lower()], int(fund_date[0]))
-                        
-                    if "N/A" in total_quotas:
-                        total_quotas = None
-                    else:
-                        total_quotas = float(total_quotas.replace(".", ""))
-
-                    if "N/A" in mgmt_type:
-                        mgmt_type = None
-                    
-                    if "N/A" in admin_tax:
-                        admin_tax = None
-                    
-                    if "N/A" in perf_tax:
-                        perf_tax = None
-
-                    if "N/A" in target:
-                        target = None
-
-                    if "N/A" in segment:
-                        segment = None
-
-                    if "N/A" in mandate:
-                        mandate = None
-
-                    proc_data["Data de Constituição do Fundo"].append(fund_date)
-                    proc_data["Cotas Emitidas"].append(total_quotas)
-                    proc_data["Tipo de Gestão"].append(mgmt_type)
-                    proc_data["Público Alvo"].append(target)
-                    proc_data["Mandato"].append(mandate)
-                    proc_data["Segmento"].append(segment)
-                    proc_data["Prazo de Duração"].append(term)
-                    proc_data["Taxa de Administração"].append(admin_tax)
-                    proc_data["Taxa de Performance"].append(perf_tax)
-    
-    funds_df = pd.DataFrame(proc_data, columns=new_columns)
-
-    out_path = os.path.abspath(os.curdir) + '\\data-processing\\data\\funds.pkl'
-    funds_df.to_pickle(out_path)
\ No newline at end of file
+    for new_key, key in [("Tipo de Gestão", 'TIPO DE GESTÃO'), ("Público Alvo", 'PÚBLICO-ALVO'), ("Mandato", 'MANDATO'), ("Segmento", 'SEGMENTO'),
+                         ("Taxa de Administração", 'TAXA DE ADMINISTRAÇÃO'), ("Taxa de Performance", 'TAXA DE PERFORMANCE')]:
+        processed[new_key] = as_cells(basic_info[key], ~not_available[key])
+
+    return processed
+
+def process_columns(funds_df_raw):
+    # column-wise version of the scraped cells parsing, every column is processed at once into the lists of funds.pkl
+    funds_df_raw = funds_df_raw.reset_index(drop=True)
+    proc_data = {}
+
+    for key in text_columns:
+        proc_data[key] = process_text(funds_df_raw[key], key)
+    for key in ["Ativos Atuais", "Cotações Históricas"] + series_columns + ["Vacância Histórica"]:
+        proc_data[key] = process_history(funds_df_raw[key], key)
+    proc_data.update(process_indicators(funds_df_raw["Principais Indicadores"]))
+    proc_data.update(process_basic_info(funds_df_raw["Informações Básicas"]))
+
+    return proc_data
+
+def to_frame(proc_data):
+    return pd.DataFrame({key: proc_data[key] for key in new_columns}, columns=new_columns)
+
+def process_funds(funds_df_raw):
+    return to_frame(process_columns(funds_df_raw))
+
+def process_chunks(chunks, workers):
+    # chunks are parsed in a process pool, at most two per worker are read ahead so memory is bounded by the chunk size
+    # the lists are joined before building the frame, so the dtypes come out as if the whole file had been processed at once
+    proc_data = {key: [] for key in new_columns}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = collections.deque()
+
+        def collect():
+            for key, values in running.popleft().result().items():
+                proc_data[key].extend(values)
+
+        for chunk in chunks:
+            if len(running) >= 2*workers:
+                collect()
+            running.append(executor.submit(process_columns, chunk))
+
+        while len(running) > 0:
+            collect()
+
+    return to_frame(proc_data)
+
+def save_series(folder, name, dates, values, lengths):
+    # <name>.dates.npy (datetime64[s]) and <name>.values.npy (float64) hold every fund one after the other,
+    # fund i is rows offsets[i]:offsets[i+1] of <name>.offsets.npy, an empty slice stands for a missing history
+    np.save(os.path.join(folder, name + ".dates.npy"), np.array(dates, dtype="datetime64[s]"))
+    np.save(os.path.join(folder, name + ".values.npy"), values)
+    np.save(os.path.join(folder, name + ".offsets.npy"), np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64))
+
+def save_dataset(funds_df, folder):
+    # typed alternative to funds.pkl, read back with notebook/utils.py FundsDataset
+    os.makedirs(folder, exist_ok=True)
+    scalar_columns = [key for key in new_columns if key not in series_files and key not in ["Vacância Histórica", "Ativos Atuais"]]
+    funds_df[scalar_columns].to_parquet(os.path.join(folder, "scalars.parquet"), index=False)
+
+    for key, name in series_files.items():
+        cells = [cell if cell is not None else [[], []] for cell in funds_df[key]]
+        values = np.array([value for cell in cells for value in cell[1]], dtype=float)
+        save_series(folder, name, [date for cell in cells for date in cell[0]], values, [len(cell[0]) for cell in cells])
+
+    cells = [cell if cell is not None else {"date": []} for cell in funds_df["Vacância Histórica"]]
+    values = np.empty((sum([len(cell["date"]) for cell in cells]), len(vacancy_columns)))
+    for index, column in enumerate(vacancy_columns):
+        values[:, index] = np.array([value for cell in cells for value in cell.get(column, [None]*len(cell["date"]))], dtype=float)
+    save_series(folder, "vacancy", [date for cell in cells for date in cell["date"]], values, [len(cell["date"]) for cell in cells])
+
+    with open(os.path.join(folder, "assets.json"), 'w', encoding="utf-8") as assets_file:
+        json.dump(funds_df["Ativos Atuais"].tolist(), assets_file, ensure_ascii=False)
+
+    with open(os.path.join(folder, "dataset.json"), 'w', encoding="utf-8") as meta_file:
+        json.dump({
+            "version": 1, "rows": len(funds_df), "columns": new_columns, "scalars": scalar_columns,
+            "series": dict(series_files, **{"Vacância Histórica": "vacancy"}), "vacancy_columns": vacancy_columns
+        }, meta_file, ensure_ascii=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processes the scraped funds data into funds.pkl")
+    parser.add_argument("input", nargs="?", default=os.path.abspath(os.curdir) + '\\data-processing\\data\\2020-05-31 23_04_05 - Funds Data.csv',
+                        help="csv file or folder of parquet tables written by the scraper")
+    parser.add_argument("--chunksize", type=int, default=0, help="read the csv in chunks of this many rows, parsed in parallel")
+    parser.add_argument("--format", choices=["pickle", "dataset"], default="pickle", help="funds.pkl or the typed funds dataset folder")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes parsing the chunks")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input):
+        funds_df = process_funds(load_parquet(args.input))
+    elif args.chunksize > 0:
+        funds_df = process_chunks(pd.read_csv(args.input, quotechar='"', chunksize=args.chunksize), max(1, args.workers))
+    else:
+        funds_df = process_funds(pd.read_csv(args.input, quotechar='"'))
+
+    if args.format == "dataset":
+        out_path = os.path.abspath(os.curdir) + '\\data-processing\\data\\funds'
+        save_dataset(funds_df, out_path)
+    else:
+        out_path = os.path.abspath(os.curdir) + '\\data-processing\\data\\funds.pkl'
+        funds_df.to_pickle(out_path)
@@ -0,0 +1,348 @@
+# asyncio variant of FundsExplorerScraper: every page and price request is a coroutine,
+# bounded by a global semaphore and a token bucket per host, and the sections are parsed
+# from the static html with the same parse_* helpers used by the synchronous scraper
+
+import json
+import random
+import asyncio
+import functools
+import logging as log
+from typing import Type, List, Dict
+from urllib.parse import urlparse
+import aiohttp
+from lxml import html # parsing pages locally
+from lxml.etree import _Element as Element # for typing
+
+from core.constants import (FUNDSEXPLORER_CHART_URL, HTTP_TIMEOUT, HTTP_USER_AGENT, ASYNC_CONCURRENCY, ASYNC_RATE_LIMITS,
+    ASYNC_DEFAULT_RATE_LIMIT, ASYNC_MAX_RETRIES, ASYNC_BACKOFF, PRICES_INCREMENTAL_PERIOD)
+from core.data_utils import RealStateFund, FundsJournal, unique_funds
+from core.cache_utils import ResponseCache
+from core.price_utils import PriceHistoryStore
+from core.scraping_utils import XPath, element_text, element_inner_html, parse_pairs, parse_chart_data, parse_vacancy, parse_assets
+
+RETRY_STATUS: List[int] = [429, 500, 502, 503, 504]
+
+class TokenBucket:
+    # allows `rate` requests per second on average, with bursts of up to `capacity` requests
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate: float = rate
+        self.capacity: float = max(1, capacity)
+        self.tokens: float = self.capacity
+        self.updated: float = asyncio.get_event_loop().time()
+
+    async def acquire(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            now: float = loop.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens)/self.rate)
+
+
+class AsyncFundsExplorerScraper:
+    def __init__(self, base_url: str, concurrency: int = ASYNC_CONCURRENCY, rate_limits: Dict[str, float] = ASYNC_RATE_LIMITS,
+                 max_retries: int = ASYNC_MAX_RETRIES, cache: Type[ResponseCache] = None, price_store: Type[PriceHistoryStore] = None):
+        # must be used as `async with AsyncFundsExplorerScraper(...) as scraper:` so the session is opened and closed
+        log.info('Starting async webscraper script')
+        self.base_url: str = base_url
+        self.cache: Type[ResponseCache] = cache
+        self.price_store: Type[PriceHistoryStore] = price_store
+        self.concurrency: int = concurrency
+        self.rate_limits: Dict[str, float] = rate_limits
+        self.max_retries: int = max_retries
+
+        self.__session: Type[aiohttp.ClientSession] = None
+        self.__semaphore: Type[asyncio.Semaphore] = None
+        self.__buckets: Dict[str, Type[TokenBucket]] = {}
+        self.__pages: Dict[str, Type[asyncio.Future]] = {} # fund pages being requested, shared by the get_* of a fund
+
+
+    async def __aenter__(self):
+        self.__semaphore = asyncio.Semaphore(self.concurrency)
+        self.__session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            headers={"User-Agent": HTTP_USER_AGENT}
+        )
+        return self
+
+
+    async def __aexit__(self, *exc):
+        log.info("Closing async scraper session")
+        await self.__session.close()
+
+
+    def __bucket(self, url: str) -> Type[TokenBucket]:
+        host: str = urlparse(url).netloc
+        if host not in self.__buckets:
+            self.__buckets[host] = TokenBucket(self.rate_limits.get(host, ASYNC_DEFAULT_RATE_LIMIT))
+        return self.__buckets[host]
+
+
+    async def __blocking(self, function, *args, **kwargs):
+        # disk reads and writes (cache entries, price histories, journal fsyncs) run in the default executor, so the
+        # event loop keeps serving the other requests meanwhile
+        return await asyncio.get_event_loop().run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+
+    async def __fetch(self, url: str, section: str = "page") -> str:
+        # section picks the cache ttl of the response
+        entry: dict = None
+        headers: Dict[str, str] = {}
+        if self.cache is not None:
+            entry = await self.__blocking(self.cache.lookup, url, section)
+            if entry is not None and entry["fresh"]:
+                log.info(f'Serving { url } from cache')
+                return entry["text"]
+            if entry is not None:
+                headers = self.cache.validators(entry)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                # the host token is taken before a global slot, requests sleeping on a slow host would hold the slots
+                # the other hosts could be using
+                await self.__bucket(url).acquire()
+                async with self.__semaphore:
+                    log.info(f'Requesting { url }')
+                    async with self.__session.get(url, headers=headers) as response:
+                        if response.status == 304 and entry is not None:
+                            log.info(f'{ url } not modified, serving from cache')
+                            await self.__blocking(self.cache.revalidated, url)
+                            return entry["text"]
+
+                        if response.status not in RETRY_STATUS:
+                            response.raise_for_status()
+                            text: str = await response.text()
+
+                            if self.cache is not None:
+                                await self.__blocking(self.cache.put, url, section, text, etag=response.headers.get("ETag", ""),
+                                                     last_modified=response.headers.get("Last-Modified", ""))
+                            return text
+
+                        error: str = f'status { response.status }'
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRY_STATUS:
+                    raise
+                error: str = str(e) or type(e).__name__
+
+            if attempt == self.max_retries:
+                break
+
+            # full jitter keeps concurrent retries from hitting the host at the same time
+            delay: float = random.uniform(0, ASYNC_BACKOFF*(2**attempt))
+            log.warning(f'Request to { url } failed ({ error }), retrying in { delay:.2f} s')
+            await asyncio.sleep(delay)
+
+        raise IOError(f'Unable to get { url } after { self.max_retries + 1 } attempts - { error }')
+
+
+    async def __fetch_page(self, full_url: str, section: str) -> Type[Element]:
+        return html.fromstring(await self.__fetch(full_url, section))
+
+
+    async def __get_page(self, url: str, section: str = "page") -> Type[Element]:
+        # every section of a fund awaits the same request and parsed page
+        full_url: str = self.base_url + url
+        if full_url not in self.__pages:
+            self.__pages[full_url] = asyncio.ensure_future(self.__fetch_page(full_url, section))
+
+        return await self.__pages[full_url]
+
+
+    def __release_page(self, url: str):
+        self.__pages.pop(self.base_url + url, None)
+
+
+    async def get_funds_list(self, url: str, items_location: XPath) -> List[Type[RealStateFund]]:
+        page: Type[Element] = await self.__get_page(url, "list")
+        self.__release_page(url)
+
+        log.info(f'Getting funds list from { items_location }')
+        found_elements: List[str] = [element_text(element) for element in page.xpath(items_location)]
+
+        funds_list: List[Type[RealStateFund]] = []
+        for element in found_elements:
+            splitted_element: List[str] = element.split("\n")
+            funds_list.append(RealStateFund(splitted_element[0], splitted_element[1], splitted_element[3]))
+
+        if len(funds_list) > 0:
+            log.info(f'Got { len(funds_list) } funds')
+        else:
+            log.warning('No funds were found')
+
+        return funds_list
+
+
+    async def get_funds_prices(self, fund: Type[RealStateFund], url: str) -> bool:
+        # same incremental behaviour as FundsExplorerScraper.get_funds_prices, returns whether the prices were fetched
+        try:
+            log.info(f'Getting prices of fund { fund.ticker }')
+
+            price_url: str = url.replace("#", fund.ticker[0:4])
+            prices: List[Dict[str, str]] = None
+
+            stored: List[Dict[str, str]] = await self.__blocking(self.price_store.load, fund.ticker) if self.price_store is not None else None
+            if stored is not None:
+                try:
+                    window_url: str = price_url.replace("periodo=max", f'periodo={ PRICES_INCREMENTAL_PERIOD }')
+                    window: List[Dict[str, str]] = json.loads(await self.__fetch(window_url, "prices"))['stockReports']
+                    prices = await self.__blocking(self.price_store.append, fund.ticker, stored, window)
+                except Exception as e:
+                    log.warning(f'Unable to get recent prices of { fund.ticker } - { e }')
+
+            if prices is None:
+                prices = json.loads(await self.__fetch(price_url, "prices"))['stockReports']
+                if self.price_store is not None:
+                    await self.__blocking(self.price_store.replace, fund.ticker, prices)
+
+            fund.add_prices(prices)
+            return True
+
+        except Exception as e:
+            log.warning(f'Unable to get prices of { fund.ticker } - { e }')
+            return False
+
+
+    async def get_main_indicators(self, fund: Type[RealStateFund], path: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            fund.add_main_indicators(parse_pairs([element_text(element) for element in page.xpath(path)]))
+
+        except Exception as e:
+            log.warning(f'Unable to get indicators of { fund.ticker } - { e }')
+            fund.add_main_indicators({})
+
+
+    async def get_description(self, fund: Type[RealStateFund], path: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            fund.add_description(element_text(page.xpath(path)[0]))
+
+        except Exception as e:
+            log.warning(f'Unable to get description of { fund.ticker } - { e }')
+            fund.add_description("")
+
+
+    async def get_basic_info(self, fund: Type[RealStateFund], path: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            fund.add_basic_info(parse_pairs([element_text(element) for element in page.xpath(path)]))
+
+        except Exception as e:
+            log.warning(f'Unable to get basic info of { fund.ticker } - { e }')
+            fund.add_basic_info({})
+
+
+    async def get_dividends(self, fund: Type[RealStateFund], path: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            fund.add_dividends(parse_chart_data(element_inner_html(page.xpath(path)[0]), 3, 6))
+
+        except Exception:
+            log.warning(f'Unable to get dividends of fund { fund.ticker }')
+            fund.add_dividends([[], []])
+
+
+    async def get_dividend_yield(self, fund: Type[RealStateFund], path: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            fund.add_dividend_yield(parse_chart_data(element_inner_html(page.xpath(path)[0]), 3, 6))
+
+        except Exception:
+            log.warning(f'Unable to get dividend yield of fund { fund.ticker }')
+            fund.add_dividend_yield([[], []])
+
+
+    async def get_equity_value(self, fund: Type[RealStateFund], path: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            fund.add_equity_value(parse_chart_data(element_inner_html(page.xpath(path)[0]), 3, 5))
+
+        except Exception:
+            log.warning(f'Unable to get equity value of fund { fund.ticker }')
+            fund.add_equity_value([[], []])
+
+
+    async def get_vacancy(self, fund: Type[RealStateFund], path: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            fund.add_vacancy(parse_vacancy(element_inner_html(page.xpath(path)[0])))
+
+        except Exception:
+            log.warning(f'Unable to get vacancy of fund { fund.ticker }')
+            fund.add_vacancy({})
+
+
+    async def get_assets(self, fund: Type[RealStateFund], path_data: XPath, path_assets: XPath):
+        try:
+            page: Type[Element] = await self.__get_page(f'/funds/{ fund.ticker.lower() }')
+            items: List[str] = [element_text(element) for element in page.xpath(path_assets)]
+            fund.add_assets(parse_assets(element_inner_html(page.xpath(path_data)[0]), items))
+
+        except Exception:
+            log.warning(f'Unable to get assets of fund { fund.ticker }')
+            fund.add_assets({})
+
+
+    async def scrape_fund(self, fund: Type[RealStateFund], chart_url: str = FUNDSEXPLORER_CHART_URL) -> bool:
+        # same sections as scraping_utils.scrape_fund, the page request is shared and runs alongside the prices
+        # returns whether the fund page and the prices were fetched, sections missing from a fetched page are only left empty
+        log.info(f'Scraping information about fund { fund.ticker }')
+
+        results: list = await asyncio.gather(
+            self.get_funds_prices(fund, chart_url),
+            self.get_main_indicators(fund, "//section[@id='main-indicators']//span[not(contains(@class, 'indicator-value-unit'))]"),
+            self.get_basic_info(fund, "//section[@id='basic-infos']//span[contains(@class, 'title') or contains(@class, 'description')]"),
+            self.get_description(fund, "//section[@id='description']"),
+            self.get_dividends(fund, path="//div[@id='dividends-chart-wrapper']//script"),
+            self.get_dividend_yield(fund, path="//div[@id='yields-chart-wrapper']//script"),
+            self.get_equity_value(fund, path="//div[@id='patrimonial-value-chart-wrapper']//script"),
+            self.get_vacancy(fund, path="//div[@id='vacancy-chart-wrapper']//script"),
+            self.get_assets(fund, path_data="//div[@id='fund-actives-chart']//script", path_assets="//div[@id='fund-actives-items-wrapper']//div[@class='item']")
+        )
+
+        page: Type[asyncio.Future] = self.__pages.get(self.base_url + f'/funds/{ fund.ticker.lower() }')
+        page_fetched: bool = page is not None and page.done() and not page.cancelled() and page.exception() is None
+        self.__release_page(f'/funds/{ fund.ticker.lower() }')
+
+        if not (page_fetched and results[0]):
+            log.warning(f'Fund { fund.ticker } is incomplete (page fetched: { page_fetched }, prices fetched: { results[0] })')
+            print(f'Failed fund { fund.ticker }')
+            return False
+
+        print(f'Got fund { fund.ticker }')
+        return True
+
+
+    async def scrape_funds(self, funds: List[Type[RealStateFund]], chart_url: str = FUNDSEXPLORER_CHART_URL,
+                           journal: Type[FundsJournal] = None) -> List[Type[RealStateFund]]:
+        # gather keeps the results in the same order as the funds list, each fund is journaled as soon as it is done
+        # funds whose page or prices could not be fetched are left out of the journal, so a resumed run scrapes them again
+        log.info(f'Scraping { len(funds) } funds (max { self.concurrency } concurrent requests)')
+
+        async def scrape_and_journal(fund: Type[RealStateFund]) -> Type[RealStateFund]:
+            if await self.scrape_fund(fund, chart_url) and journal is not None:
+                await self.__blocking(journal.append, fund)
+            return fund
+
+        return list(await asyncio.gather(*[scrape_and_journal(fund) for fund in funds]))
+
+
+async def scrape_all_funds(base_url: str, chart_url: str = FUNDSEXPLORER_CHART_URL, journal: Type[FundsJournal] = None,
+                           **scraper_options) -> List[Type[RealStateFund]]:
+    # fund list and every fund missing from the journal in a single session
+    async with AsyncFundsExplorerScraper(base_url, **scraper_options) as scraper:
+        funds_data: List[Type[RealStateFund]] = unique_funds(await scraper.get_funds_list("/funds", "//div[@class='item']"))
+        print(f'Found { len(funds_data) } funds')
+
+        finished: Dict[str, Type[RealStateFund]] = journal.load() if journal is not None else {}
+        missing: List[Type[RealStateFund]] = [fund for fund in funds_data if fund.ticker not in finished]
+        await scraper.scrape_funds(missing, chart_url, journal)
+
+        return [finished.get(fund.ticker, fund) for fund in funds_data]
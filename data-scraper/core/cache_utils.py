@@ -0,0 +1,144 @@
+from typing import Dict, List
+import logging as log
+import os
+import json
+import time
+import hashlib
+import threading
+
+from core.constants import CACHE_MAX_BYTES, CACHE_TTLS
+
+class ResponseCache:
+    # on-disk cache of raw pages and price json, one body + metadata file per url (named by the url hash)
+    # entries expire after the ttl of their section and the least recently used ones are evicted past max_bytes
+    def __init__(self, folder: str, max_bytes: int = CACHE_MAX_BYTES, ttls: Dict[str, int] = CACHE_TTLS):
+        self.folder: str = folder
+        self.max_bytes: int = max_bytes
+        self.ttls: Dict[str, int] = ttls
+
+        self.__lock: threading.Lock = threading.Lock() # a cache may be shared by every scraper of a pool
+        os.makedirs(self.folder, exist_ok=True)
+        self.__size: int = sum([meta["size"] for meta in self.__all_meta()])
+
+        log.info(f'Using response cache at { self.folder } ({ self.__size } bytes)')
+
+
+    def __paths(self, url: str) -> List[str]:
+        key: str = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return [os.path.join(self.folder, key + ".body"), os.path.join(self.folder, key + ".json")]
+
+
+    def __read_meta(self, meta_path: str) -> dict:
+        try:
+            with open(meta_path) as meta_file:
+                return json.load(meta_file)
+        except (IOError, ValueError):
+            return None
+
+
+    def __write(self, path: str, content: str):
+        # written aside and renamed, so a crash never leaves half an entry behind
+        with open(path + ".tmp", 'w', encoding="utf-8") as tmp_file:
+            tmp_file.write(content)
+        os.replace(path + ".tmp", path)
+
+
+    def __all_meta(self) -> List[dict]:
+        all_meta: List[dict] = []
+        for filename in os.listdir(self.folder):
+            if filename.endswith(".json"):
+                meta: dict = self.__read_meta(os.path.join(self.folder, filename))
+                if meta is not None:
+                    all_meta.append(meta)
+        return all_meta
+
+
+    def __remove(self, url: str):
+        for path in self.__paths(url):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+    def __evict(self):
+        all_meta: List[dict] = sorted(self.__all_meta(), key=lambda meta: meta["accessed"])
+        self.__size = sum([meta["size"] for meta in all_meta])
+
+        for meta in all_meta:
+            if self.__size <= self.max_bytes:
+                break
+            log.info(f'Evicting { meta["url"] } from cache')
+            self.__remove(meta["url"])
+            self.__size -= meta["size"]
+
+
+    def lookup(self, url: str, section: str) -> dict:
+        # entry metadata ("fetched", "etag", "last_modified"...) plus its "text" and "fresh" state, None on a miss
+        body_path, meta_path = self.__paths(url)
+        with self.__lock:
+            meta: dict = self.__read_meta(meta_path)
+            if meta is None or meta["url"] != url or meta["section"] != section:
+                return None
+
+            try:
+                with open(body_path, encoding="utf-8") as body_file:
+                    text: str = body_file.read()
+            except IOError:
+                return None
+
+            meta["accessed"] = time.time()
+            self.__write(meta_path, json.dumps(meta))
+
+        meta["text"] = text
+        meta["fresh"] = time.time() - meta["fetched"] < self.ttls.get(section, 0)
+        return meta
+
+
+    def get(self, url: str, section: str) -> str:
+        # text of a fresh entry, None when missing or expired
+        entry: dict = self.lookup(url, section)
+        if entry is None or not entry["fresh"]:
+            return None
+
+        log.info(f'Serving { url } from cache')
+        return entry["text"]
+
+
+    def put(self, url: str, section: str, text: str, etag: str = "", last_modified: str = ""):
+        body_path, meta_path = self.__paths(url)
+        size: int = len(text.encode("utf-8"))
+        meta: dict = {
+            "url": url, "section": section, "size": size, "fetched": time.time(), "accessed": time.time(),
+            "etag": etag, "last_modified": last_modified
+        }
+
+        with self.__lock:
+            previous: dict = self.__read_meta(meta_path)
+            if previous is not None:
+                self.__size -= previous["size"]
+
+            self.__write(body_path, text)
+            self.__write(meta_path, json.dumps(meta))
+            self.__size += size
+
+            if self.__size > self.max_bytes:
+                self.__evict()
+
+
+    def validators(self, entry: dict) -> Dict[str, str]:
+        # headers for a conditional request revalidating an expired entry
+        headers: Dict[str, str] = {}
+        if entry["etag"] != "":
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"] != "":
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+    def revalidated(self, url: str):
+        # the server answered 304, the entry counts as freshly fetched again
+        body_path, meta_path = self.__paths(url)
+        with self.__lock:
+            meta: dict = self.__read_meta(meta_path)
+            if meta is not None:
+                meta["fetched"] = time.time()
+                self.__write(meta_path, json.dumps(meta))
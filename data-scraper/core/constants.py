@@ -7,4 +7,50 @@ PAGE_LOADING_TIMEOUT: int = 5
 
 # funds explorer consts
 FUNDSEXPLORER_BASE_URL: str = "https://www.fundsexplorer.com.br"
-FUNDSEXPLORER_CHART_URL: str = "https://chart.fundsexplorer.com.br/#/cotacoes/?periodo=max" # ticker will be added at '#'
\ No newline at end of file
+FUNDSEXPLORER_CHART_URL: str = "https://chart.fundsexplorer.com.br/#/cotacoes/?periodo=max" # ticker will be added at '#'
+
+# scraping pool settings
+SCRAPER_WORKERS: int = 4 # number of browser instances running in parallel
+SCRAPER_MAX_ATTEMPTS: int = 3 # times a fund is handed back to the queue before giving up
+
+# http backend settings
+HTTP_TIMEOUT: int = 10
+HTTP_POOL_SIZE: int = 10 # connections kept alive per host
+HTTP_USER_AGENT: str = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.61 Safari/537.36"
+
+# async engine settings
+ASYNC_CONCURRENCY: int = 16 # requests in flight at the same time, all hosts together
+ASYNC_RATE_LIMITS: dict = { # requests per second for each host
+    "www.fundsexplorer.com.br": 4,
+    "chart.fundsexplorer.com.br": 8
+}
+ASYNC_DEFAULT_RATE_LIMIT: float = 4
+ASYNC_MAX_RETRIES: int = 4
+ASYNC_BACKOFF: float = 0.5 # seconds, doubled on every retry and jittered
+
+# response cache settings
+CACHE_FOLDER: str = "/data-scraper/cache/"
+CACHE_MAX_BYTES: int = 512*1024*1024
+CACHE_TTLS: dict = { # seconds each kind of response is served without being requested again
+    "list": 24*60*60, # funds list page
+    "page": 12*60*60, # static fund page
+    "rendered": 12*60*60, # fund page source taken from the browser
+    "prices": 12*60*60 # chart api json
+}
+
+# incremental prices settings
+PRICES_FOLDER: str = "/data-scraper/data/prices/" # stored price history of every fund
+PRICES_INCREMENTAL_PERIOD: str = "1m" # chart api period requested when a stored history exists, replaces periodo=max
+
+# export settings
+CSV_FLUSH_EVERY: int = 10 # rows written between flushes of the csv file
+PARQUET_ROW_GROUP_FUNDS: int = 50 # funds buffered before a row group is written to every parquet table
+
+# metrics settings
+METRICS_LATENCY_BUCKETS: list = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30] # upper bounds in seconds of the latency histograms
+
+# adaptive waiting settings
+WAIT_POLL_INTERVAL: float = 0.1 # seconds between two checks of the page containers
+WAIT_ABSENT_GRACE: float = 1.0 # seconds a container missing from a loaded page is still waited for
+WAIT_ABSENT_RATIO: float = 0.8 # containers missing from at least this share of loaded pages are not waited for at all
+WAIT_MIN_OBSERVATIONS: int = 20 # loaded pages seen before a container can be taken as usually missing
@@ -1,10 +1,176 @@
-from typing import Dict, List, Type
+from typing import Dict, List, Type, Iterable
 import logging as log
+import threading
+import json
 import csv
 import os
+import numpy as np
+
+from core.constants import CSV_FLUSH_EVERY
+
+MONTHS: List[str] = [
+    "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
+]
+
+VACANCY_COLUMNS: List[str] = ["Ocupação Física", "Vacância Física", "Ocupação Financeira", "Vacância Financeira"]
+
+class FundSeries:
+    # compact history of a fund: dates as a datetime64 array and values as a float64 matrix with one column per name
+    # kind is the scraped shape it comes from and is rendered back to: "prices" (stockReports rows, "fec" first and then every
+    # other field), "chart" ([labels, values] with "Mês/Ano" labels) or "vacancy" ({"date": labels, column: values...})
+    __slots__ = ("kind", "dates", "values", "columns")
+
+    def __init__(self, kind: str, dates: np.ndarray, values: np.ndarray, columns: List[str]):
+        self.kind: str = kind
+        self.dates: np.ndarray = dates
+        self.values: np.ndarray = values
+        self.columns: List[str] = columns
+
+    def __len__(self):
+        return len(self.dates)
+
+    def column(self, name: str) -> np.ndarray:
+        # view of the values of one column, no copy
+        return self.values[:, self.columns.index(name)]
+
+    @staticmethod
+    def empty(kind: str) -> 'FundSeries':
+        columns: List[str] = VACANCY_COLUMNS if kind == "vacancy" else ["fec"] if kind == "prices" else ["value"]
+        return FundSeries(kind, np.array([], dtype="datetime64[s]" if kind == "prices" else "datetime64[M]"), np.empty((0, len(columns))), columns)
+
+    @staticmethod
+    def __price_fields(records) -> List[str]:
+        # every field of the stockReports rows besides the date, in the order they first show up
+        fields: dict = {"fec": None}
+        for record in records:
+            if isinstance(record, dict):
+                fields.update(dict.fromkeys(record))
+        return [field for field in fields if field != "data"]
+
+    @staticmethod
+    def __parse_months(labels: List[str]) -> np.ndarray:
+        months: List[str] = []
+        for label in labels:
+            month, year = label.split("/")
+            months.append(f'{ int(year):04d}-{ [name.lower() for name in MONTHS].index(month.lower()) + 1:02d}')
+        return np.array(months, dtype="datetime64[M]")
+
+    @staticmethod
+    def from_records(kind: str, records) -> 'FundSeries':
+        # builds the series from the scraped shape of its kind
+        if records is None or len(records) == 0 or (kind == "chart" and len(records[0]) == 0):
+            return FundSeries.empty(kind)
+
+        try:
+            return FundSeries.__from_arrays(kind, records)
+        except (ValueError, TypeError, KeyError, AttributeError, IndexError):
+            # a malformed point must not wipe out the whole history, the series is parsed again point by point
+            return FundSeries.__from_points(kind, records)
+
+    @staticmethod
+    def __from_arrays(kind: str, records) -> 'FundSeries':
+        if kind == "prices":
+            dates: np.ndarray = np.array([record["data"].replace(" ", "T") for record in records], dtype="datetime64[s]")
+            columns: List[str] = FundSeries.__price_fields(records)
+            values: np.ndarray = np.array([[record.get(column, np.nan) for column in columns] for record in records], dtype=float)
+            return FundSeries(kind, dates, values.reshape(-1, len(columns)), columns)
+
+        if kind == "chart":
+            if len(records[0]) != len(records[1]):
+                raise ValueError("labels and values of different lengths")
+            values: np.ndarray = np.array(records[1], dtype=float).reshape(-1, 1)
+            return FundSeries(kind, FundSeries.__parse_months(records[0]), values, ["value"])
+
+        values: np.ndarray = np.array([records[column] for column in VACANCY_COLUMNS], dtype=float).T.reshape(-1, len(VACANCY_COLUMNS))
+        return FundSeries(kind, FundSeries.__parse_months(records["date"]), values, VACANCY_COLUMNS)
+
+    @staticmethod
+    def __from_points(kind: str, records) -> 'FundSeries':
+        # points with a date that can not be read are skipped, values that are not numbers become NaN
+        if kind == "prices":
+            columns: List[str] = FundSeries.__price_fields(records)
+            points: list = [
+                (record.get("data"), [record.get(column) for column in columns]) if isinstance(record, dict) else (None, []) for record in records
+            ]
+        elif kind == "chart":
+            columns: List[str] = ["value"]
+            points: list = [(label, [value]) for label, value in zip(records[0], records[1])]
+            if len(records[0]) != len(records[1]):
+                log.warning(f'Chart with { len(records[0]) } labels and { len(records[1]) } values, keeping the first { len(points) }')
+        else:
+            columns: List[str] = VACANCY_COLUMNS
+            series: List[list] = [records.get(column) or [] for column in columns]
+            points: list = [
+                (label, [column[index] if index < len(column) else None for column in series]) for index, label in enumerate(records.get("date") or [])
+            ]
+
+        dates: list = []
+        values: List[List[float]] = []
+        skipped: int = 0
+        invalid: int = 0
+        for label, point in points:
+            date = FundSeries.__parse_date(kind, label)
+            if date is None:
+                skipped += 1
+                continue
+
+            row: List[float] = []
+            for value in point:
+                try:
+                    row.append(float(value))
+                except (TypeError, ValueError):
+                    row.append(np.nan)
+                    invalid += value is not None
+            dates.append(date)
+            values.append(row)
+
+        log.warning(f'Malformed { kind } series read point by point: { skipped } points without a valid date skipped, { invalid } invalid values kept as NaN')
+        return FundSeries(kind, np.array(dates, dtype="datetime64[s]" if kind == "prices" else "datetime64[M]"),
+                          np.array(values, dtype=float).reshape(-1, len(columns)), columns)
+
+    @staticmethod
+    def __parse_date(kind: str, label):
+        try:
+            if kind == "prices":
+                return np.datetime64(label.replace(" ", "T"), "s")
+            return FundSeries.__parse_months([label])[0]
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def __labels(self) -> List[str]:
+        return [f'{ MONTHS[int(month) % 12] }/{ int(month) // 12 + 1970 }' for month in self.dates.astype(np.int64)]
+
+    def to_records(self):
+        # the scraped shape of the series, written to the csv and the journal
+        # missing values (NaN) are left out instead of written as None, which data-processing can not parse: price rows
+        # without a closing price and chart or vacancy points with a missing value are skipped, other price fields are omitted
+        if self.kind == "prices":
+            records: List[dict] = []
+            for date, row in zip(np.datetime_as_string(self.dates, unit="s"), self.values.tolist()):
+                if row[0] == row[0]:
+                    record: dict = {"data": str(date).replace("T", " ")}
+                    record.update({column: value for column, value in zip(self.columns, row) if value == value})
+                    records.append(record)
+            return records
+
+        complete: np.ndarray = ~np.isnan(self.values).any(axis=1)
+        labels: List[str] = [label for label, keep in zip(self.__labels(), complete.tolist()) if keep]
+        if self.kind == "chart":
+            return [labels, self.values[complete, 0].tolist()]
+
+        if len(labels) == 0:
+            return {}
+        return dict({"date": labels}, **{column: self.values[complete, index].tolist() for index, column in enumerate(self.columns)})
+
 
 class RealStateFund:
     # class for handling a Real Estate Fund data
+    # histories are kept as FundSeries, a fund with max-period prices takes a few kilobytes
+    __slots__ = (
+        "ticker", "name", "admin", "prices", "indicators", "description", "basic_info", "dividends", "dividend_yield", "equity_value",
+        "vacancy", "assets"
+    )
+
     def __init__(self, ticker: str, name: str, admin: str):
         # ticker is the Bovespa ticker of the fund XXXX11 or XXXX11B
         # name is the official name of the fund
@@ -13,21 +179,21 @@ class RealStateFund:
         self.name: str = name
         self.admin: str = admin
 
-        self.prices: Dict[str, str] = {}
+        self.prices: FundSeries = FundSeries.empty("prices")
         self.indicators: Dict[str, str] = {}
         self.description: str = ""
         self.basic_info: Dict[str, str] = {}
-        self.dividends: List[List[str]] = []
-        self.dividend_yield: List[List[str]] = []
-        self.equity_value: List[List[str]] = []
-        self.vacancy: Dict[str, List[str]] = {}
+        self.dividends: FundSeries = FundSeries.empty("chart")
+        self.dividend_yield: FundSeries = FundSeries.empty("chart")
+        self.equity_value: FundSeries = FundSeries.empty("chart")
+        self.vacancy: FundSeries = FundSeries.empty("vacancy")
         self.assets: dict = {}
     
     def __str__(self):
         return f'{ self.ticker }: { self.name } ({ self.admin })'
 
-    def add_prices(self, prices: Dict[str, str]):
-        self.prices: Dict[str, str] = prices
+    def add_prices(self, prices: List[Dict[str, str]]):
+        self.prices: FundSeries = FundSeries.from_records("prices", prices)
 
     def add_main_indicators(self, indicators: Dict[str, str]):
         self.indicators: Dict[str, str] = indicators
@@ -39,65 +205,157 @@ class RealStateFund:
         self.basic_info: Dict[str, str] = info
 
     def add_dividends(self, dividends: List[List[str]]):
-        self.dividends: List[List[str]] = dividends
+        self.dividends: FundSeries = FundSeries.from_records("chart", dividends)
 
     def add_dividend_yield(self, dividend_yield: List[List[str]]):
-        self.dividend_yield: List[List[str]] = dividend_yield
+        self.dividend_yield: FundSeries = FundSeries.from_records("chart", dividend_yield)
 
     def add_equity_value(self, equity_value: List[List[str]]):
-        self.equity_value: List[List[str]] = equity_value
+        self.equity_value: FundSeries = FundSeries.from_records("chart", equity_value)
 
     def add_vacancy(self, vacancy: Dict[str, List[str]]):
-        self.vacancy: Dict[str, List[str]] = vacancy
+        self.vacancy: FundSeries = FundSeries.from_records("vacancy", vacancy)
 
     def add_assets(self, assets: dict):
         self.assets: dict = assets
 
+    def to_dict(self) -> dict:
+        return {
+            "ticker": self.ticker, "name": self.name, "admin": self.admin, "prices": self.prices.to_records(), "indicators": self.indicators,
+            "description": self.description, "basic_info": self.basic_info, "dividends": self.dividends.to_records(),
+            "dividend_yield": self.dividend_yield.to_records(), "equity_value": self.equity_value.to_records(),
+            "vacancy": self.vacancy.to_records(), "assets": self.assets
+        }
 
+    @staticmethod
+    def from_dict(data: dict) -> 'RealStateFund':
+        fund: RealStateFund = RealStateFund(data["ticker"], data["name"], data["admin"])
+        fund.add_prices(data["prices"])
+        fund.add_main_indicators(data["indicators"])
+        fund.add_description(data["description"])
+        fund.add_basic_info(data["basic_info"])
+        fund.add_dividends(data["dividends"])
+        fund.add_dividend_yield(data["dividend_yield"])
+        fund.add_equity_value(data["equity_value"])
+        fund.add_vacancy(data["vacancy"])
+        fund.add_assets(data["assets"])
+        return fund
 
-def convert_to_csv(funds_data: List[Type[RealStateFund]], filename: str):
-    log.info(f'Converting data from { len(funds_data) } funds')
-    
-    csv_columns: List[str] = ["Ticker", "Nome", "Administrador", "Cotações Históricas", "Principais Indicadores", "Descrição", "Informações Básicas", "Dividendos Históricos", 
-        "Dividend Yield Histórico", "Valor Patrimonial Histórico", "Vacância Histórica", "Ativos Atuais"
-    ]
 
-    dict_data: List[Dict[str, str]] = []
+def unique_funds(funds: List[Type[RealStateFund]]) -> List[Type[RealStateFund]]:
+    # first fund of every ticker, in the list order, a fund listed twice would otherwise be scraped and written twice
+    unique: Dict[str, Type[RealStateFund]] = {}
+    for fund in funds:
+        unique.setdefault(fund.ticker, fund)
+
+    if len(unique) < len(funds):
+        log.warning(f'Ignoring { len(funds) - len(unique) } repeated funds of the list')
+    return list(unique.values())
+
+
+class FundsJournal:
+    # checkpoint of a scraping run, every fully scraped fund is appended as a json line as soon as it is done
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self.__lock: threading.Lock = threading.Lock() # funds are appended by every worker of a pool
+
+    def append(self, fund: Type[RealStateFund]):
+        line: str = json.dumps(fund.to_dict())
+        with self.__lock:
+            with open(self.filename, 'a') as journal:
+                journal.write(line + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def load(self) -> Dict[str, Type[RealStateFund]]:
+        # finished funds by ticker, a line torn by a crash is ignored and its fund scraped again
+        funds: Dict[str, Type[RealStateFund]] = {}
+        if not os.path.exists(self.filename):
+            return funds
+
+        line: str = "\n"
+        with open(self.filename) as journal:
+            for line in journal:
+                try:
+                    fund: Type[RealStateFund] = RealStateFund.from_dict(json.loads(line))
+                    funds[fund.ticker] = fund
+                except (ValueError, KeyError):
+                    log.warning(f'Ignoring incomplete line of journal { self.filename }')
+
+        if not line.endswith("\n"):
+            # terminates the torn line so the next appended fund starts on its own line
+            with open(self.filename, 'a') as journal:
+                journal.write("\n")
 
-    for fund in funds_data:
+        log.info(f'Loaded { len(funds) } funds from journal { self.filename }')
+        return funds
+
+
+CSV_COLUMNS: List[str] = ["Ticker", "Nome", "Administrador", "Cotações Históricas", "Principais Indicadores", "Descrição", "Informações Básicas", "Dividendos Históricos", 
+    "Dividend Yield Histórico", "Valor Patrimonial Histórico", "Vacância Histórica", "Ativos Atuais"
+]
+
+class CsvFundsWriter:
+    # writes each fund as a csv row as soon as it arrives, so no fund is kept around after being written
+    def __init__(self, filename: str, flush_every: int = CSV_FLUSH_EVERY):
+        self.filename: str = filename
+        self.flush_every: int = flush_every
+        self.written: int = 0
+
+        log.info(f'Writting csv file { filename }')
+        self.__csvfile = open(filename, 'w')
+        self.__writer = csv.DictWriter(self.__csvfile, fieldnames=CSV_COLUMNS)
+        self.__writer.writeheader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, fund: Type[RealStateFund]):
         try:
             log.info(f'Converting fund { fund.ticker } ...')
-            dict_data.append(
+            self.__writer.writerow(
                 {
                     "Ticker": fund.ticker,
                     "Nome": fund.name,
                     "Administrador": fund.admin,
-                    "Cotações Históricas": fund.prices,
+                    "Cotações Históricas": fund.prices.to_records(),
                     "Principais Indicadores": fund.indicators,
                     "Descrição": fund.description,
                     "Informações Básicas": fund.basic_info,
-                    "Dividendos Históricos": fund.dividends,
-                    "Dividend Yield Histórico": fund.dividend_yield,
-                    "Valor Patrimonial Histórico": fund.equity_value,
-                    "Vacância Histórica": fund.vacancy,
+                    "Dividendos Históricos": fund.dividends.to_records(),
+                    "Dividend Yield Histórico": fund.dividend_yield.to_records(),
+                    "Valor Patrimonial Histórico": fund.equity_value.to_records(),
+                    "Vacância Histórica": fund.vacancy.to_records(),
                     "Ativos Atuais": fund.assets,
                 }
             )
+            self.written += 1
 
+        except IOError:
+            raise
         except Exception as e:
             log.error(f'Failed to convert fund { fund.ticker } - { e }')
+            return
+
+        if self.written % self.flush_every == 0:
+            self.__csvfile.flush()
+
+    def close(self):
+        self.__csvfile.close()
+        log.info(f'Successfully written { self.written } funds to csv file { self.filename }')
 
-    log.info(f'Successfully converted { len(dict_data) } funds')
-    log.info(f'Writting csv file { filename }')
+
+def convert_to_csv(funds_data: Iterable[Type[RealStateFund]], filename: str):
+    # funds_data may be any iterable, e.g. funds coming straight from the scraping loop
+    log.info('Converting funds data to csv')
 
     try:
-        with open(filename, 'w') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=csv_columns)
-            writer.writeheader()
-            for data in dict_data:
-                writer.writerow(data)
-                
+        with CsvFundsWriter(filename) as writer:
+            for fund in funds_data:
+                writer.write(fund)
+
     except IOError:
         log.error("I/O error")
-
-    log.info(f'Successfully written csv file { filename }')
\ No newline at end of file
@@ -0,0 +1,81 @@
+from typing import Dict, Type
+import logging as log
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse, quote
+
+from core.constants import HTTP_TIMEOUT, HTTP_POOL_SIZE, HTTP_USER_AGENT
+from core.cache_utils import ResponseCache
+
+def recorded_file(record_folder: str, host: str, path: str, query: str = "") -> str:
+    # every url is a folder of its own, <host>/<path>/index.html, so a page never collides with the pages under it
+    # (/funds and /funds/abcd11), the query string is part of the file name so price windows are kept apart
+    name: str = "index.html" if query == "" else f'index-{ quote(query, safe="") }.html'
+    return os.path.join(record_folder, host.replace(":", "_"), path.strip("/"), name)
+
+
+class HttpFetcher:
+    # pooled keep-alive session used to get pages and the chart api without a browser
+    def __init__(self, timeout: int = HTTP_TIMEOUT, pool_size: int = HTTP_POOL_SIZE, record_folder: str = "", cache: Type[ResponseCache] = None):
+        # record_folder keeps a copy of every response, laid out by host and url path, to be served later by stub-server.py
+        # with a cache, fresh responses are served from disk and expired ones are revalidated with conditional requests
+        self.timeout: int = timeout
+        self.record_folder: str = record_folder
+        self.cache: Type[ResponseCache] = cache
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": HTTP_USER_AGENT})
+
+
+    def __record(self, url: str, text: str):
+        parsed = urlparse(url)
+        filename: str = recorded_file(self.record_folder, parsed.netloc, parsed.path, parsed.query)
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'w', encoding="utf-8") as recorded:
+                recorded.write(text)
+        except IOError as e:
+            log.warning(f'Unable to record { url } - { e }')
+
+
+    def get_text(self, url: str, section: str = "page") -> str:
+        # section picks the cache ttl of the response
+        entry: dict = None
+        headers: Dict[str, str] = {}
+        if self.cache is not None:
+            entry = self.cache.lookup(url, section)
+            if entry is not None and entry["fresh"]:
+                log.info(f'Serving { url } from cache')
+                return entry["text"]
+            if entry is not None:
+                headers = self.cache.validators(entry)
+
+        log.info(f'Requesting { url }')
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+
+        if response.status_code == 304 and entry is not None:
+            log.info(f'{ url } not modified, serving from cache')
+            self.cache.revalidated(url)
+            return entry["text"]
+
+        response.raise_for_status()
+
+        if "charset" not in response.headers.get("Content-Type", ""):
+            response.encoding = response.apparent_encoding # requests would fall back to latin-1 for text pages
+
+        if self.record_folder != "":
+            self.__record(url, response.text)
+
+        if self.cache is not None:
+            self.cache.put(url, section, response.text, etag=response.headers.get("ETag", ""), last_modified=response.headers.get("Last-Modified", ""))
+
+        return response.text
+
+
+    def close(self):
+        log.info("Closing http session")
+        self.session.close()
@@ -0,0 +1,172 @@
+from typing import Dict, List, Tuple, Callable
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+import logging as log
+import functools
+import json
+import threading
+import time
+
+from core.constants import METRICS_LATENCY_BUCKETS
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]] # metric name and its sorted labels
+
+
+class ScraperMetrics:
+    # counters and latency histograms of a scraping run, shared by every scraper of a pool (all updates hold a lock)
+    # metrics are named like prometheus ones and told apart by labels, e.g. increment("timeouts", section="dividends")
+    def __init__(self, buckets: List[float] = METRICS_LATENCY_BUCKETS):
+        self.buckets: List[float] = sorted(buckets)
+        self.started: float = time.time()
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__counters: Dict[MetricKey, int] = {}
+        self.__histograms: Dict[MetricKey, dict] = {}
+        self.__server: HTTPServer = None
+
+
+    def __key(self, name: str, labels: Dict[str, str]) -> MetricKey:
+        return (name, tuple(sorted([(label, str(value)) for label, value in labels.items()])))
+
+
+    def increment(self, name: str, amount: int = 1, **labels):
+        key: MetricKey = self.__key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + amount
+
+
+    def observe(self, name: str, seconds: float, **labels):
+        key: MetricKey = self.__key(name, labels)
+        with self.__lock:
+            histogram: dict = self.__histograms.get(key)
+            if histogram is None:
+                histogram = {"counts": [0]*(len(self.buckets) + 1), "count": 0, "sum": 0.0, "min": seconds, "max": seconds}
+                self.__histograms[key] = histogram
+
+            bucket: int = len(self.buckets) # last one is +Inf
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    bucket = index
+                    break
+
+            histogram["counts"][bucket] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["min"] = min(histogram["min"], seconds)
+            histogram["max"] = max(histogram["max"], seconds)
+
+
+    def failure(self, section: str, error: Exception):
+        # timeouts waiting for a container are told apart from every other error
+        if isinstance(error, TimeoutError) or type(error).__name__ == "TimeoutException":
+            self.increment("timeouts", section=section)
+        else:
+            self.increment("exceptions", section=section, error=type(error).__name__)
+
+
+    def summary(self) -> dict:
+        # machine-readable snapshot of every metric, histogram buckets are cumulative like prometheus ones
+        with self.__lock:
+            counters: List[dict] = [
+                {"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.__counters.items())
+            ]
+            histograms: List[dict] = []
+            for (name, labels), histogram in sorted(self.__histograms.items()):
+                cumulative: List[int] = []
+                for count in histogram["counts"]:
+                    cumulative.append(count + (cumulative[-1] if len(cumulative) > 0 else 0))
+
+                histograms.append({
+                    "name": name, "labels": dict(labels), "count": histogram["count"], "sum": histogram["sum"],
+                    "mean": histogram["sum"]/histogram["count"], "min": histogram["min"], "max": histogram["max"],
+                    "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], cumulative))
+                })
+
+        return {"started": self.started, "elapsed": time.time() - self.started, "counters": counters, "histograms": histograms}
+
+
+    def dump(self, filename: str):
+        log.info(f'Writting scraping metrics to { filename }')
+        try:
+            with open(filename, 'w', encoding="utf-8") as metrics_file:
+                json.dump(self.summary(), metrics_file, indent=2)
+
+        except IOError:
+            log.error("I/O error")
+
+
+    def prometheus(self) -> str:
+        # prometheus text exposition format
+        lines: List[str] = []
+
+        def labels_text(labels: Dict[str, str]) -> str:
+            if len(labels) == 0:
+                return ""
+            escaped: Dict[str, str] = {label: value.replace("\\", "\\\\").replace('"', '\\"') for label, value in labels.items()}
+            return "{" + ",".join([f'{ label }="{ value }"' for label, value in escaped.items()]) + "}"
+
+        summary: dict = self.summary()
+        for counter in summary["counters"]:
+            lines.append(f'scraper_{ counter["name"] }_total{ labels_text(counter["labels"]) } { counter["value"] }')
+        for histogram in summary["histograms"]:
+            name: str = f'scraper_{ histogram["name"] }'
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{ name }_bucket{ labels_text(dict(histogram["labels"], le=bound)) } { count }')
+            lines.append(f'{ name }_sum{ labels_text(histogram["labels"]) } { histogram["sum"] }')
+            lines.append(f'{ name }_count{ labels_text(histogram["labels"]) } { histogram["count"] }')
+
+        return "\n".join(lines) + "\n"
+
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        # live metrics on http://host:port/metrics (prometheus) and /metrics.json, served from a daemon thread
+        metrics: ScraperMetrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.summary()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+
+                data: bytes = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass # scrapes of the endpoint would flood the log
+
+        class MetricsServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.__server = MetricsServer((host, port), MetricsHandler)
+        threading.Thread(target=self.__server.serve_forever, name="metrics-server", daemon=True).start()
+        log.info(f'Serving scraping metrics on http://{ host }:{ self.__server.server_port }/metrics')
+        return self.__server.server_port
+
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+
+def timed(section: str) -> Callable:
+    # records how long every call of a scraper method takes in the "section_seconds" histogram
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start: float = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.metrics.observe("section_seconds", time.perf_counter() - start, section=section)
+        return wrapper
+    return decorator
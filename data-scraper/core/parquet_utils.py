@@ -0,0 +1,140 @@
+from typing import Dict, List, Type, Iterable
+import logging as log
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.constants import PARQUET_ROW_GROUP_FUNDS
+from core.data_utils import RealStateFund, FundSeries, VACANCY_COLUMNS
+
+# one normalized table of funds plus a long table for each time series, joined by "Ticker"
+SCHEMAS: Dict[str, Type[pa.Schema]] = {
+    "funds": pa.schema([
+        ("Ticker", pa.string()), ("Nome", pa.string()), ("Administrador", pa.string()), ("Descrição", pa.string()),
+        ("Principais Indicadores", pa.map_(pa.string(), pa.string())), ("Informações Básicas", pa.map_(pa.string(), pa.string()))
+    ]),
+    "prices": pa.schema([("Ticker", pa.string()), ("Data", pa.timestamp("s")), ("Cotação", pa.float64())]),
+    "dividends": pa.schema([("Ticker", pa.string()), ("Data", pa.timestamp("s")), ("Dividendo", pa.float64())]),
+    "yields": pa.schema([("Ticker", pa.string()), ("Data", pa.timestamp("s")), ("Dividend Yield", pa.float64())]),
+    "equity": pa.schema([("Ticker", pa.string()), ("Data", pa.timestamp("s")), ("Valor Patrimonial", pa.float64())]),
+    "vacancy": pa.schema([("Ticker", pa.string()), ("Data", pa.timestamp("s"))] + [(column, pa.float64()) for column in VACANCY_COLUMNS]),
+    "assets": pa.schema([("Ticker", pa.string()), ("UF", pa.string()), ("Área", pa.float64())]),
+    "asset_items": pa.schema([("Ticker", pa.string()), ("Ativo", pa.string()), ("Informação", pa.string()), ("Valor", pa.string())])
+}
+
+def parse_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def series_columns(ticker: str, series: Type[FundSeries], names: List[str]) -> Dict[str, list]:
+    # columns of a long table straight from the series arrays, without copying the values
+    return dict(
+        {"Ticker": [ticker]*len(series), "Data": series.dates.astype("datetime64[s]")},
+        **{name: series.values[:, index] for index, name in enumerate(names)}
+    )
+
+
+def fund_to_rows(fund: Type[RealStateFund]) -> Dict[str, Dict[str, list]]:
+    # column chunks of every table for a single fund
+    rows: Dict[str, Dict[str, list]] = {
+        "funds": {
+            "Ticker": [fund.ticker], "Nome": [fund.name], "Administrador": [fund.admin], "Descrição": [fund.description],
+            "Principais Indicadores": [list(fund.indicators.items())], "Informações Básicas": [list(fund.basic_info.items())]
+        },
+        "prices": series_columns(fund.ticker, fund.prices, ["Cotação"]),
+        "dividends": series_columns(fund.ticker, fund.dividends, ["Dividendo"]),
+        "yields": series_columns(fund.ticker, fund.dividend_yield, ["Dividend Yield"]),
+        "equity": series_columns(fund.ticker, fund.equity_value, ["Valor Patrimonial"]),
+        "vacancy": series_columns(fund.ticker, fund.vacancy, VACANCY_COLUMNS),
+        "assets": {"Ticker": [], "UF": [], "Área": []},
+        "asset_items": {"Ticker": [], "Ativo": [], "Informação": [], "Valor": []}
+    }
+
+    if len(fund.assets) > 0:
+        for uf, area in zip(fund.assets["Location"][0], fund.assets["Location"][1]):
+            rows["assets"]["Ticker"].append(fund.ticker)
+            rows["assets"]["UF"].append(uf)
+            rows["assets"]["Área"].append(parse_float(area))
+
+        for asset, infos in fund.assets["Assets"].items():
+            for info, value in infos.items():
+                rows["asset_items"]["Ticker"].append(fund.ticker)
+                rows["asset_items"]["Ativo"].append(asset)
+                rows["asset_items"]["Informação"].append(info)
+                rows["asset_items"]["Valor"].append(value)
+
+    return rows
+
+
+class ParquetFundsWriter:
+    # writes the funds as one parquet file per table inside folder, a row group every row_group_funds funds
+    def __init__(self, folder: str, row_group_funds: int = PARQUET_ROW_GROUP_FUNDS):
+        self.folder: str = folder
+        self.row_group_funds: int = row_group_funds
+        self.written: int = 0
+
+        log.info(f'Writting parquet files to { folder }')
+        os.makedirs(folder, exist_ok=True)
+        self.__writers: Dict[str, Type[pq.ParquetWriter]] = {
+            name: pq.ParquetWriter(os.path.join(folder, f'{ name }.parquet'), schema) for name, schema in SCHEMAS.items()
+        }
+        self.__buffer: Dict[str, Dict[str, list]] = self.__empty_buffer()
+        self.__buffered: int = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __empty_buffer(self) -> Dict[str, Dict[str, list]]:
+        # chunks of every column, one per buffered fund
+        return {name: {column: [] for column in schema.names} for name, schema in SCHEMAS.items()}
+
+    def __flush(self):
+        for name, schema in SCHEMAS.items():
+            columns: List[Type[pa.ChunkedArray]] = [
+                pa.chunked_array([pa.array(chunk, type=field.type, from_pandas=True) for chunk in self.__buffer[name][field.name]], type=field.type)
+                for field in schema
+            ]
+            self.__writers[name].write_table(pa.Table.from_arrays(columns, schema=schema))
+        self.__buffer = self.__empty_buffer()
+        self.__buffered = 0
+
+    def write(self, fund: Type[RealStateFund]):
+        try:
+            rows: Dict[str, Dict[str, list]] = fund_to_rows(fund)
+        except Exception as e:
+            log.error(f'Failed to convert fund { fund.ticker } to parquet - { e }')
+            return
+
+        for name, columns in rows.items():
+            for column, values in columns.items():
+                self.__buffer[name][column].append(values)
+        self.__buffered += 1
+        self.written += 1
+
+        if self.__buffered >= self.row_group_funds:
+            self.__flush()
+
+    def close(self):
+        if self.__buffered > 0:
+            self.__flush()
+        for writer in self.__writers.values():
+            writer.close()
+        log.info(f'Successfully written { self.written } funds to parquet files in { self.folder }')
+
+
+def convert_to_parquet(funds_data: Iterable[Type[RealStateFund]], folder: str):
+    log.info('Converting funds data to parquet')
+
+    try:
+        with ParquetFundsWriter(folder) as writer:
+            for fund in funds_data:
+                writer.write(fund)
+
+    except IOError:
+        log.error("I/O error")
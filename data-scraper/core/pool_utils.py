@@ -0,0 +1,141 @@
+from typing import Type, List, Dict, Iterator
+import logging as log
+import queue
+import threading
+
+from core.constants import SCRAPER_WORKERS, SCRAPER_MAX_ATTEMPTS
+from core.scraping_utils import FundsExplorerScraper, scrape_fund
+from core.data_utils import RealStateFund, FundsJournal
+
+class ScraperPool:
+    # runs several scrapers in parallel, each one with its own Chrome instance
+    # threads are enough here: the heavy work happens inside the chromedriver processes
+    def __init__(self, base_url: str, workers: int = SCRAPER_WORKERS, max_attempts: int = SCRAPER_MAX_ATTEMPTS,
+                 journal: Type[FundsJournal] = None, **scraper_options):
+        # scraper_options are handed to every FundsExplorerScraper created by the workers
+        # funds scraped successfully are appended to the journal, so a crashed run can be resumed
+        self.base_url: str = base_url
+        self.journal: Type[FundsJournal] = journal
+        self.scraper_options: dict = scraper_options
+        self.workers: int = max(1, workers)
+        self.max_attempts: int = max_attempts
+
+        self.__tasks: queue.Queue = queue.Queue()
+        self.__pending: int = 0
+        self.__results: Dict[int, Type[RealStateFund]] = {} # finished funds by position, until they are yielded
+        self.__finished: threading.Condition = threading.Condition()
+
+
+    def __task_done(self, index: int, fund: Type[RealStateFund]):
+        with self.__finished:
+            self.__pending -= 1
+            self.__results[index] = fund
+            self.__finished.notify_all()
+
+
+    def __has_pending(self) -> bool:
+        with self.__finished:
+            return self.__pending > 0
+
+
+    def __create_scraper(self, worker: int) -> Type[FundsExplorerScraper]:
+        try:
+            return FundsExplorerScraper(self.base_url, **self.scraper_options)
+        except Exception as e:
+            log.error(f'Worker { worker } was unable to create a browser instance - { e }')
+            return None
+
+
+    def __close_scraper(self, scraper: Type[FundsExplorerScraper]):
+        try:
+            scraper.close()
+        except Exception as e:
+            log.warning(f'Unable to close browser instance - { e }')
+
+
+    def __worker(self, worker: int):
+        scraper: Type[FundsExplorerScraper] = self.__create_scraper(worker)
+
+        while scraper is not None and self.__has_pending():
+            try:
+                index, fund, attempts = self.__tasks.get(timeout=1)
+            except queue.Empty:
+                continue # another worker may still hand a fund back
+
+            log.info("---------------------------------------------")
+            log.info(f'Worker { worker } scraping information about fund { fund.ticker } [{ index+1 }]')
+            print(f'Getting fund { fund.ticker } [{ index+1 }]')
+
+            try:
+                # incomplete funds (outages, error pages) are handed back and never journaled, so a resumed run retries them
+                if not scrape_fund(scraper, fund):
+                    raise IOError(f'Page or prices of { fund.ticker } could not be fetched')
+                if self.journal is not None:
+                    self.journal.append(fund)
+                self.__task_done(index, fund)
+
+            except Exception as e:
+                attempts += 1
+                if attempts < self.max_attempts:
+                    log.warning(f'Worker { worker } failed on fund { fund.ticker } ({ attempts }/{ self.max_attempts }), handing it back - { e }')
+                    self.__tasks.put((index, fund, attempts))
+                else:
+                    log.error(f'Giving up fund { fund.ticker } after { attempts } attempts - { e }')
+                    self.__task_done(index, fund)
+
+                # the browser is not trusted anymore after a failure
+                self.__close_scraper(scraper)
+                scraper = self.__create_scraper(worker)
+
+        if scraper is not None:
+            self.__close_scraper(scraper)
+
+        log.info(f'Worker { worker } finished')
+
+
+    def iter_run(self, funds: List[Type[RealStateFund]]) -> Iterator[Type[RealStateFund]]:
+        # starts the workers and yields the funds in the original order as soon as each one is done
+        log.info(f'Scraping { len(funds) } funds with { self.workers } workers')
+
+        self.__results = {}
+        self.__tasks = queue.Queue()
+        self.__pending = len(funds)
+        for index, fund in enumerate(funds):
+            self.__tasks.put((index, fund, 0))
+
+        threads: List[threading.Thread] = [
+            threading.Thread(target=self.__worker, args=(worker,), name=f'scraper-{ worker }')
+            for worker in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        return self.__iter_results(len(funds), threads)
+
+
+    def __iter_results(self, total: int, threads: List[threading.Thread]) -> Iterator[Type[RealStateFund]]:
+        for index in range(total):
+            with self.__finished:
+                while index not in self.__results and any([thread.is_alive() for thread in threads]):
+                    self.__finished.wait(timeout=1)
+
+                if index not in self.__results:
+                    self.__drain_tasks()
+                fund: Type[RealStateFund] = self.__results.pop(index)
+
+            yield fund
+
+        for thread in threads:
+            thread.join()
+
+
+    def __drain_tasks(self):
+        # every worker died: the remaining funds are kept, only without the scraped data
+        while not self.__tasks.empty():
+            index, fund, attempts = self.__tasks.get_nowait()
+            log.error(f'Fund { fund.ticker } was not scraped')
+            self.__results[index] = fund
+
+
+    def run(self, funds: List[Type[RealStateFund]]) -> List[Type[RealStateFund]]:
+        return list(self.iter_run(funds))
@@ -0,0 +1,82 @@
+from typing import Dict, List
+import logging as log
+import os
+import json
+
+class PriceHistoryStore:
+    # local time series of every fund price history, one json lines file per ticker with the stockReports rows ordered by 'data'
+    # the last row is the high-water mark: new rows are only appended after it
+    def __init__(self, folder: str):
+        self.folder: str = folder
+        os.makedirs(self.folder, exist_ok=True)
+
+
+    def __path(self, ticker: str) -> str:
+        return os.path.join(self.folder, f'{ ticker.upper() }.jsonl')
+
+
+    def load(self, ticker: str) -> List[Dict[str, str]]:
+        # stored rows, None when missing or failing the consistency check
+        try:
+            with open(self.__path(ticker)) as history_file:
+                rows: List[Dict[str, str]] = [json.loads(line) for line in history_file if line.strip() != ""]
+        except (IOError, ValueError):
+            return None
+
+        if len(rows) == 0:
+            return None
+
+        for index, row in enumerate(rows):
+            if not "data" in row or not "fec" in row:
+                log.warning(f'Stored prices of { ticker } have a row without date or price')
+                return None
+            if index > 0 and rows[index-1]["data"] >= row["data"]:
+                log.warning(f'Stored prices of { ticker } are not ordered at { row["data"] }')
+                return None
+
+        return rows
+
+
+    def replace(self, ticker: str, rows: List[Dict[str, str]]):
+        # full history, deduplicated by date and written aside then renamed
+        unique_rows: Dict[str, Dict[str, str]] = {row["data"]: row for row in rows}
+        path: str = self.__path(ticker)
+
+        with open(path + ".tmp", 'w') as history_file:
+            for date in sorted(unique_rows):
+                history_file.write(json.dumps(unique_rows[date]) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+    def append(self, ticker: str, stored: List[Dict[str, str]], window: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        # merges a trailing window into the stored rows, None when they do not agree and a full fetch is needed
+        if len(window) == 0:
+            return stored
+
+        stored_prices: Dict[str, float] = {row["data"]: float(row["fec"]) for row in stored}
+        high_water_mark: str = stored[-1]["data"]
+        window: List[Dict[str, str]] = sorted(window, key=lambda row: row["data"])
+
+        if window[0]["data"] > high_water_mark:
+            log.warning(f'Prices window of { ticker } starts after { high_water_mark }, there is a gap in the stored history')
+            return None
+
+        for row in window:
+            if stored[0]["data"] <= row["data"] <= high_water_mark:
+                stored_price: float = stored_prices.get(row["data"])
+                if stored_price is None or abs(stored_price - float(row["fec"])) > 1e-6*max(1, abs(stored_price)):
+                    log.warning(f'Prices of { ticker } changed at { row["data"] }, the stored history is outdated')
+                    return None
+
+        new_rows: List[Dict[str, str]] = []
+        for row in window:
+            if row["data"] > high_water_mark and (len(new_rows) == 0 or new_rows[-1]["data"] != row["data"]):
+                new_rows.append(row)
+
+        if len(new_rows) > 0:
+            log.info(f'Appending { len(new_rows) } prices of { ticker } after { high_water_mark }')
+            with open(self.__path(ticker), 'a') as history_file:
+                for row in new_rows:
+                    history_file.write(json.dumps(row) + "\n")
+
+        return stored + new_rows
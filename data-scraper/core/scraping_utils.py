@@ -14,25 +14,137 @@
 #   sudo ln -s /usr/local/share/chromedriver /usr/bin/chromedriver
 
 import json
+import re
+import time
 import logging as log
 from typing import NewType, Type, List, Dict
+from lxml import html # parsing page snapshots locally
+from lxml.etree import _Element as Element # for typing
 from selenium import webdriver #  launch/initialize a browser
-from selenium.webdriver.common.by import By # search with specific parameters
-from selenium.webdriver.support.ui import WebDriverWait # wait page laoding content
-from selenium.webdriver.support import expected_conditions as EC # determine if the page has loaded all content
 from selenium.webdriver.remote.webelement import WebElement # for typing
-from selenium.common.exceptions import TimeoutException # handling timeout
+from selenium.common.exceptions import WebDriverException # handling browser failures
 
-from core.constants import CHROMEDRIVER_EXECUTABLE_PATH, PAGE_LOADING_TIMEOUT, FUNDSEXPLORER_CHART_URL
+from core.constants import CHROMEDRIVER_EXECUTABLE_PATH, PAGE_LOADING_TIMEOUT, FUNDSEXPLORER_CHART_URL, PRICES_INCREMENTAL_PERIOD, WAIT_POLL_INTERVAL
 from core.data_utils import RealStateFund
+from core.http_utils import HttpFetcher
+from core.cache_utils import ResponseCache
+from core.price_utils import PriceHistoryStore
+from core.metrics_utils import ScraperMetrics, timed
+from core.wait_utils import SectionPresence, CONTAINERS_STATE_SCRIPT, DOCUMENT_TEXT_SCRIPT
 
 XPath = NewType('XPath', str)
 
+# containers of every section read from a fund page, waited at once in snapshot mode
+FUND_PAGE_CONTAINERS: List[XPath] = [
+    "//section[@id='main-indicators']", "//section[@id='basic-infos']", "//section[@id='description']",
+    "//div[@id='dividends-chart-wrapper']", "//div[@id='yields-chart-wrapper']", "//div[@id='patrimonial-value-chart-wrapper']",
+    "//div[@id='vacancy-chart-wrapper']", "//div[@id='fund-actives-chart']", "//div[@id='fund-actives-items-wrapper']"
+]
+
+# tags rendered on their own line by the browser, used to mimic WebElement.text on snapshots
+BLOCK_TAGS: List[str] = [
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "fieldset", "figcaption", "figure", "footer", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "tr", "ul"
+]
+
+def element_text(element: Type[Element]) -> str:
+    # text of a snapshot element as the browser would render it: one line per block, collapsed whitespace
+    parts: List[str] = []
+
+    def walk(node: Type[Element]):
+        if not isinstance(node.tag, str) or node.tag in ["script", "style"]:
+            return
+
+        if node.tag == "br":
+            parts.append("\n")
+            return
+
+        is_block: bool = node.tag in BLOCK_TAGS
+        if is_block: parts.append("\n")
+        if node.text: parts.append(re.sub(r"\s+", " ", node.text))
+        for child in node:
+            walk(child)
+            if child.tail: parts.append(re.sub(r"\s+", " ", child.tail))
+        if is_block: parts.append("\n")
+
+    walk(element)
+    lines: List[str] = [" ".join(line.split()) for line in "".join(parts).split("\n")]
+    return "\n".join([line for line in lines if line != ""])
+
+
+def element_inner_html(element: Type[Element]) -> str:
+    # equivalent of get_attribute("innerHTML") for snapshot elements
+    inner_html: str = element.text or ""
+    for child in element:
+        inner_html += html.tostring(child, encoding="unicode")
+    return inner_html
+
+
+def parse_pairs(elements: List[str]) -> Dict[str, str]:
+    # sections listed as title, value, title, value...
+    elements_dict: Dict[str, str] = {}
+    for i in range(0, len(elements), 2):
+        if elements[i] != "":
+            elements_dict[elements[i]] = elements[i+1]
+
+    return elements_dict
+
+
+def parse_chart_data(script: str, labels_index: int, values_index: int) -> List[List[str]]:
+    # charts are inline scripts; labels and values are the n-th '[' delimited arrays
+    data: List[str] = script.split("[")
+    return json.loads("[[" + data[labels_index].split("]")[0] + "], [" + data[values_index].split("]")[0] + "]]")
+
+
+def parse_vacancy(script: str) -> Dict[str, List[str]]:
+    vacancy: List[str] = script.split("[")
+    return json.loads('{"date":[' + vacancy[3].split("]")[0] + '], "Ocupação Física":[' + vacancy[5].split("]")[0] + '], "Vacância Física":[' + vacancy[6].split("]")[0] + '], "Ocupação Financeira":[' + vacancy[7].split("]")[0] + '], "Vacância Financeira":[' + vacancy[8].split("]")[0] + "]}")
+
+
+def parse_assets(script: str, items: List[str]) -> dict:
+    assets_data: List[List[str]] = parse_chart_data(script, 3, 5)
+
+    assets: Dict[str, Dict[str, str]] = {}
+    for asset in items:
+        info_list: List[str] = asset.split("\n")
+        asset_name: str = info_list.pop(0)
+        
+        assets[asset_name] = {}
+        for info in info_list:
+            info_split: List[str] = info.split(":")
+            assets[asset_name][info_split[0]] = info_split[1]
+
+    return {"Assets": assets, "Location": assets_data}
+
+
 class FundsExplorerScraper:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, snapshot: bool = False, backend: str = "browser", record_folder: str = "", cache: Type[ResponseCache] = None,
+                 price_store: Type[PriceHistoryStore] = None, metrics: Type[ScraperMetrics] = None, presence: Type[SectionPresence] = None):
+        # in snapshot mode a fund page is loaded and waited once, then every section is parsed from its source
+        # the "http" backend gets pages and prices with plain requests, the browser is only started for sections needing rendering
+        # the cache keeps prices, snapshots and http pages on disk between runs
+        # the price store makes price histories incremental
+        # metrics and the learned presence of sections can be shared by every scraper of a pool, otherwise each scraper keeps its own
         log.info('Starting webscraper script')
         self.base_url = base_url
-        self.__create_browser_instance()
+        self.snapshot = snapshot
+        self.backend = backend
+        self.cache = cache
+        self.price_store = price_store
+        self.metrics: Type[ScraperMetrics] = metrics if metrics is not None else ScraperMetrics()
+        self.presence: Type[SectionPresence] = presence if presence is not None else SectionPresence()
+
+        self.__page: Type[Element] = None # last snapshot taken
+        self.__page_url: str = ""
+        self.__page_rendered: bool = False # snapshots taken by the browser have already waited for every container
+        self.__source: Type[Element] = None # where the current section is read from, None reads from the browser
+
+        self.browser = None
+        self.http: Type[HttpFetcher] = None
+        if self.backend == "http":
+            self.http = HttpFetcher(record_folder=record_folder, cache=cache)
+        else:
+            self.__create_browser_instance()
 
 
     def __create_browser_instance(self):
@@ -46,35 +158,209 @@ class FundsExplorerScraper:
         self.browser = webdriver.Chrome(executable_path=CHROMEDRIVER_EXECUTABLE_PATH, chrome_options=option)
         
 
+    def __driver_call(self, call: str, amount: int = 1):
+        self.metrics.increment("webdriver_calls", amount, call=call)
+
+
     def __get_page(self, url: str, base_url: str = ''):
         if base_url == '': 
             base_url = self.base_url
 
         full_url: str = base_url + url
 
+        if self.browser is None:
+            log.info(f'{ full_url } needs rendering, starting browser')
+            self.__create_browser_instance()
+
+        self.__driver_call("current_url")
         if not full_url == self.browser.current_url:
             log.info(f'Browser is getting { full_url }')
+            start: float = time.perf_counter()
+            self.__driver_call("get")
             self.browser.get(full_url)
+            self.metrics.observe("navigation_seconds", time.perf_counter() - start)
+            self.metrics.increment("navigations")
+        else:
+            self.metrics.increment("navigations_skipped")
+
+
+    def __wait_containers(self, containers: List[XPath]) -> Dict[XPath, str]:
+        # polls the state of every container in one script call until they are all visible, the timeout runs out or the
+        # page is loaded and the missing ones are still absent after their grace time (none for the usually missing ones)
+        start: float = time.perf_counter()
+        loaded: float = None # when the document was first seen complete
+        self.__driver_call("wait")
+
+        while True:
+            self.__driver_call("execute_script")
+            result: dict = self.browser.execute_script(CONTAINERS_STATE_SCRIPT, containers)
+            states: Dict[XPath, str] = result["states"]
+
+            now: float = time.perf_counter()
+            if loaded is None and result["ready"] == "complete":
+                loaded = now
+
+            pending: List[XPath] = [container for container in containers if states[container] != "visible"]
+            if len(pending) == 0 or now - start >= PAGE_LOADING_TIMEOUT:
+                break
+            if loaded is not None and all([
+                states[container] == "absent" and now - loaded >= self.presence.absent_grace(container) for container in pending
+            ]):
+                break
+
+            time.sleep(WAIT_POLL_INTERVAL)
+
+        # only loaded pages say whether a container exists
+        if loaded is not None:
+            for container in containers:
+                self.presence.record(container, states[container] != "absent")
+                if states[container] == "absent":
+                    self.metrics.increment("absent_containers", container=container)
+
+        self.metrics.observe("wait_seconds", time.perf_counter() - start, container=containers[0] if len(containers) == 1 else "snapshot")
+        return states
 
 
     def __wait_browser_load(self, container: XPath):
         log.info(f'Waiting while browser is loading { container } (max timeout { PAGE_LOADING_TIMEOUT })')
+        state: str = self.__wait_containers([container])[container]
+        if state != "visible":
+            log.error(f'Container is { state } after waiting for page to load')
+            raise TimeoutError(f'{ container } is { state }')
+
+        log.info('Container successfully loaded')
+
+
+    def __wait_browser_load_all(self, containers: List[XPath]):
+        # a single wait for every container, missing ones are left out of the snapshot instead of failing it
+        log.info(f'Waiting while browser is loading { len(containers) } containers (max timeout { PAGE_LOADING_TIMEOUT })')
+        states: Dict[XPath, str] = self.__wait_containers(containers)
+
+        missing: List[XPath] = [container for container in containers if states[container] != "visible"]
+        if len(missing) > 0:
+            log.warning(f'{ len(missing) } containers were not loaded, taking snapshot of what was loaded')
+            self.metrics.increment("timeouts", section="snapshot")
+        else:
+            log.info('Containers successfully loaded')
+
+
+    def __wait_document_text(self) -> str:
+        # plain text responses (the chart api json) are read once the document is complete, no element needs to show up
+        log.info(f'Waiting while browser is loading the document (max timeout { PAGE_LOADING_TIMEOUT })')
+        start: float = time.perf_counter()
+        self.__driver_call("wait")
+
+        while True:
+            self.__driver_call("execute_script")
+            result: dict = self.browser.execute_script(DOCUMENT_TEXT_SCRIPT)
+            if result["ready"] == "complete" and result["text"]:
+                break
+            if time.perf_counter() - start >= PAGE_LOADING_TIMEOUT:
+                log.error("Timed out waiting for document to load")
+                raise TimeoutError
+
+            time.sleep(WAIT_POLL_INTERVAL)
+
+        self.metrics.observe("wait_seconds", time.perf_counter() - start, container="document")
+        return result["text"]
+
+
+    def __take_http_snapshot(self, url: str, section: str = "page"):
+        full_url: str = self.base_url + url
+        self.__page_url = full_url
+        self.__page_rendered = False
+
         try:
-            WebDriverWait(self.browser, PAGE_LOADING_TIMEOUT).until(EC.visibility_of_element_located((By.XPATH, container)))
-            log.info('Container successfully loaded')
-        except TimeoutException:
-            log.error("Timed out waiting for page to load")
-            raise TimeoutError
+            self.__page = html.fromstring(self.http.get_text(full_url, section))
+        except Exception as e:
+            log.warning(f'Unable to request { full_url }, using browser - { e }')
+            self.__page = None
 
 
-    def get_funds_list(self, url: str, container: XPath, items_location: XPath) -> List[Type[RealStateFund]]:
+    @timed("snapshot")
+    def take_snapshot(self, fund: Type[RealStateFund], containers: List[XPath] = FUND_PAGE_CONTAINERS):
+        log.info(f'Taking snapshot of fund { fund.ticker } page')
+
+        url: str = f'/funds/{ fund.ticker.lower() }'
+        if self.backend == "http":
+            self.__take_http_snapshot(url)
+            return
+
+        full_url: str = self.base_url + url
+        page_source: str = None
+        if self.cache is not None:
+            page_source = self.cache.get(full_url, "rendered")
+
+        if page_source is None:
+            self.__get_page(url=url)
+            self.__wait_browser_load_all(containers)
+            self.__driver_call("page_source")
+            page_source = self.browser.page_source
+
+            if self.cache is not None:
+                self.cache.put(full_url, "rendered", page_source)
+
+        self.__page = html.fromstring(page_source)
+        self.__page_url = full_url
+        self.__page_rendered = True
+
+
+    def __load_section(self, url: str, container: XPath, section: str = "page"):
+        # reads from the snapshot when it was taken from this url, otherwise from the live page
+        if self.backend == "http" and self.__page_url != self.base_url + url:
+            self.__take_http_snapshot(url, section)
+
+        if self.__page is not None and self.__page_url == self.base_url + url:
+            if len(self.__page.xpath(container)) > 0:
+                self.__source = self.__page
+                return
+
+            if self.__page_rendered:
+                # the snapshot already waited for every container, waiting again would only burn the timeout
+                raise TimeoutError(f'{ container } was not loaded in the snapshot')
+
+            log.info(f'{ container } is not in the static page, falling back to browser')
+
+        self.__source = None
         self.__get_page(url=url)
         self.__wait_browser_load(container)
 
+
+    def __find_texts(self, path: XPath) -> List[str]:
+        if self.__source is not None:
+            return [element_text(element) for element in self.__source.xpath(path)]
+
+        self.__driver_call("find_elements")
+        elements: List[Type[WebElement]] = self.browser.find_elements_by_xpath(path)
+        self.__driver_call("text", len(elements))
+        return [element.text for element in elements] # converting to list instead of WebElement object
+
+
+    def __find_text(self, path: XPath) -> str:
+        if self.__source is not None:
+            return element_text(self.__source.xpath(path)[0])
+
+        self.__driver_call("find_element")
+        self.__driver_call("text")
+        return self.browser.find_element_by_xpath(path).text
+
+
+    def __find_inner_html(self, path: XPath) -> str:
+        if self.__source is not None:
+            return element_inner_html(self.__source.xpath(path)[0])
+
+        self.__driver_call("find_element")
+        self.__driver_call("get_attribute")
+        return self.browser.find_element_by_xpath(path).get_attribute("innerHTML")
+
+
+    @timed("funds_list")
+    def get_funds_list(self, url: str, container: XPath, items_location: XPath) -> List[Type[RealStateFund]]:
+        self.__load_section(url, container, "list")
+
         log.info(f'Getting funds list from { items_location }')
         
-        found_elements: List[Type[WebElement]] = self.browser.find_elements_by_xpath(items_location)
-        found_elements: List[str] = [element.text for element in found_elements] # converting to list instead of WebElement object
+        found_elements: List[str] = self.__find_texts(items_location)
         
         funds_list: List[Type[RealStateFund]] = []
         for index, element in enumerate(found_elements):
@@ -91,195 +377,234 @@ class FundsExplorerScraper:
         return funds_list
 
 
-    def get_funds_prices(self, fund: Type[RealStateFund], url: str):
-        container: str = "//body"
+    def __fetch_prices(self, fund: Type[RealStateFund], price_url: str) -> List[Dict[str, str]]:
+        prices: Dict[str, str] = None
+        if self.backend == "http":
+            try:
+                prices = json.loads(self.http.get_text(price_url, "prices"))
+            except Exception as e:
+                log.warning(f'Unable to request prices of { fund.ticker }, using browser - { e }')
+
+        elif self.cache is not None:
+            cached_prices: str = self.cache.get(price_url, "prices")
+            if cached_prices is not None:
+                prices = json.loads(cached_prices)
+
+        if prices is None:
+            self.__get_page("", price_url)
+            prices_text: str = self.__wait_document_text()
+            prices = json.loads(prices_text)
+
+            if self.cache is not None:
+                self.cache.put(price_url, "prices", prices_text)
+
+        return prices['stockReports']
+
+
+    @timed("prices")
+    def get_funds_prices(self, fund: Type[RealStateFund], url: str) -> bool:
+        # with a price store only a trailing window is requested and appended to the stored history
         try: 
             log.info(f'Getting prices of fund { fund.ticker }')
 
             price_url: str = url.replace("#", fund.ticker[0:4])
-            self.__get_page("", price_url)
-            self.__wait_browser_load(container)
-            prices: Dict[str, str] = json.loads(self.browser.find_element_by_xpath(container).text)
-
-            fund.add_prices(prices['stockReports'])
+            prices: List[Dict[str, str]] = None
+
+            stored: List[Dict[str, str]] = self.price_store.load(fund.ticker) if self.price_store is not None else None
+            if stored is not None:
+                try:
+                    window_url: str = price_url.replace("periodo=max", f'periodo={ PRICES_INCREMENTAL_PERIOD }')
+                    prices = self.price_store.append(fund.ticker, stored, self.__fetch_prices(fund, window_url))
+                except Exception as e:
+                    log.warning(f'Unable to get recent prices of { fund.ticker } - { e }')
+
+            if prices is None:
+                prices = self.__fetch_prices(fund, price_url)
+                if self.price_store is not None:
+                    log.info(f'Storing full price history of { fund.ticker }')
+                    self.price_store.replace(fund.ticker, prices)
+
+            fund.add_prices(prices)
+            return True
         
         except Exception as e:
+            self.metrics.failure("prices", e)
             log.warning(f'Unable to get prices of { fund.ticker } - { e }')
+            return False
 
 
-    def get_main_indicators(self, fund: Type[RealStateFund], path: XPath):
+    @timed("main_indicators")
+    def get_main_indicators(self, fund: Type[RealStateFund], path: XPath) -> bool:
         try: 
             log.info(f'Getting indicators of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(path)
-            
-            elements: List[Type[WebElement]] = self.browser.find_elements_by_xpath(path)
-            elements: List[str] = [element.text for element in elements]
-
-            elements_dict: Dict[str, str] = {}
-            for i in range(0, len(elements), 2):
-                if elements[i] != "":
-                    elements_dict[elements[i]] = elements[i+1]
-
-            fund.add_main_indicators(elements_dict)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', path)
+            fund.add_main_indicators(parse_pairs(self.__find_texts(path)))
+            return True
         
         except Exception as e:
+            self.metrics.failure("main_indicators", e)
             log.warning(f'Unable to get indicators of { fund.ticker } - { e }')
             fund.add_main_indicators({})
+            return False
 
 
-    def get_description(self, fund: Type[RealStateFund], path: XPath):
+    @timed("description")
+    def get_description(self, fund: Type[RealStateFund], path: XPath) -> bool:
         try: 
             log.info(f'Getting description of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(path)
-            
-            element: Type[WebElement] = self.browser.find_element_by_xpath(path)
-            description: str = element.text
-
-            fund.add_description(description)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', path)
+            fund.add_description(self.__find_text(path))
+            return True
         
         except Exception as e:
+            self.metrics.failure("description", e)
             log.warning(f'Unable to get description of { fund.ticker } - { e }')
             fund.add_description("")
+            return False
 
 
-    def get_basic_info(self, fund: Type[RealStateFund], path: XPath):
+    @timed("basic_info")
+    def get_basic_info(self, fund: Type[RealStateFund], path: XPath) -> bool:
         try: 
             log.info(f'Getting basic info of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(path)
-            
-            elements: List[Type[WebElement]] = self.browser.find_elements_by_xpath(path)
-            elements: List[str] = [element.text for element in elements]
-
-            elements_dict: Dict[str, str] = {}
-            for i in range(0, len(elements), 2):
-                if elements[i] != "":
-                    elements_dict[elements[i]] = elements[i+1]
-
-            fund.add_basic_info(elements_dict)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', path)
+            fund.add_basic_info(parse_pairs(self.__find_texts(path)))
+            return True
         
         except Exception as e:
+            self.metrics.failure("basic_info", e)
             log.warning(f'Unable to get basic info of { fund.ticker } - { e }')
             fund.add_basic_info({})
+            return False
 
 
-    def get_dividends(self, fund: Type[RealStateFund], path: XPath, container: XPath):
+    @timed("dividends")
+    def get_dividends(self, fund: Type[RealStateFund], path: XPath, container: XPath) -> bool:
         try: 
             log.info(f'Getting dividends of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(container)
-            
-            element: str = self.browser.find_element_by_xpath(path).get_attribute("innerHTML")
-            dividends: List[str] = element.split("[")
-            dividends: List[List[str]] = json.loads("[[" + dividends[3].split("]")[0] + "], [" + dividends[6].split("]")[0] + "]]")
-
-            fund.add_dividends(dividends)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', container)
+            fund.add_dividends(parse_chart_data(self.__find_inner_html(path), 3, 6))
+            return True
         
         except Exception as e:
+            self.metrics.failure("dividends", e)
             log.warning(f'Unable to get dividends of fund { fund.ticker }')
             fund.add_dividends([[], []])
+            return False
 
 
-    def get_dividend_yield(self, fund: Type[RealStateFund], path: XPath, container: XPath):
+    @timed("dividend_yield")
+    def get_dividend_yield(self, fund: Type[RealStateFund], path: XPath, container: XPath) -> bool:
         try: 
             log.info(f'Getting dividend yield of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(container)
-            
-            element: str = self.browser.find_element_by_xpath(path).get_attribute("innerHTML")
-            yields: List[str] = element.split("[")
-            yields: List[List[str]] = json.loads("[[" + yields[3].split("]")[0] + "], [" + yields[6].split("]")[0] + "]]")
-
-            fund.add_dividend_yield(yields)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', container)
+            fund.add_dividend_yield(parse_chart_data(self.__find_inner_html(path), 3, 6))
+            return True
         
         except Exception as e:
+            self.metrics.failure("dividend_yield", e)
             log.warning(f'Unable to get dividend yield of fund { fund.ticker }')
             fund.add_dividend_yield([[], []])
+            return False
 
 
-    def get_equity_value(self, fund: Type[RealStateFund], path: XPath, container: XPath):
+    @timed("equity_value")
+    def get_equity_value(self, fund: Type[RealStateFund], path: XPath, container: XPath) -> bool:
         try: 
             log.info(f'Getting equity value of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(container)
-            
-            element: str = self.browser.find_element_by_xpath(path).get_attribute("innerHTML")
-            equity: List[str] = element.split("[")
-            equity: List[List[str]] = json.loads("[[" + equity[3].split("]")[0] + "], [" + equity[5].split("]")[0] + "]]")
-
-            fund.add_equity_value(equity)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', container)
+            fund.add_equity_value(parse_chart_data(self.__find_inner_html(path), 3, 5))
+            return True
         
         except Exception as e:
+            self.metrics.failure("equity_value", e)
             log.warning(f'Unable to get equity value of fund { fund.ticker }')
             fund.add_equity_value([[], []])
+            return False
 
 
-    def get_vacancy(self, fund: Type[RealStateFund], path: XPath, container: XPath):
+    @timed("vacancy")
+    def get_vacancy(self, fund: Type[RealStateFund], path: XPath, container: XPath) -> bool:
         try: 
             log.info(f'Getting vacancy of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(container)
-            
-            element: str = self.browser.find_element_by_xpath(path).get_attribute("innerHTML")
-            vacancy: List[str] = element.split("[")
-            vacancy: Dict[str, List[str]] = json.loads('{"date":[' + vacancy[3].split("]")[0] + '], "Ocupação Física":[' + vacancy[5].split("]")[0] + '], "Vacância Física":[' + vacancy[6].split("]")[0] + '], "Ocupação Financeira":[' + vacancy[7].split("]")[0] + '], "Vacância Financeira":[' + vacancy[8].split("]")[0] + "]}")
-
-            fund.add_vacancy(vacancy)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', container)
+            fund.add_vacancy(parse_vacancy(self.__find_inner_html(path)))
+            return True
         
         except Exception as e:
+            self.metrics.failure("vacancy", e)
             log.warning(f'Unable to get vacancy of fund { fund.ticker }')
             fund.add_vacancy({})
+            return False
 
 
-    def get_assets(self, fund: Type[RealStateFund], path_data: XPath, path_assets: XPath, container: XPath):
+    @timed("assets")
+    def get_assets(self, fund: Type[RealStateFund], path_data: XPath, path_assets: XPath, container: XPath) -> bool:
         try: 
             log.info(f'Getting assets of fund { fund.ticker }')
 
-            url: str = f'/funds/{ fund.ticker.lower() }'
-            self.__get_page(url=url)
-            self.__wait_browser_load(container)
-            
-            element: str = self.browser.find_element_by_xpath(path_data).get_attribute("innerHTML")
-            assets_data: List[str] = element.split("[")
-            assets_data: List[List[str]] = json.loads("[[" + assets_data[3].split("]")[0] + "], [" + assets_data[5].split("]")[0] + "]]")
-
-            elements: List[Type[WebElement]] = self.browser.find_elements_by_xpath(path_assets)
-            elements: List[str] = [element.text for element in elements]
-
-            assets: Dict[str, Dict[str, str]] = {}
-            for asset in elements:
-                info_list: List[str] = asset.split("\n")
-                asset_name: str = info_list.pop(0)
-                
-                assets[asset_name] = {}
-                for info in info_list:
-                    info_split: List[str] = info.split(":")
-                    assets[asset_name][info_split[0]] = info_split[1]
-
-            assets: dict = {"Assets": assets, "Location": assets_data}
-            fund.add_assets(assets)
+            self.__load_section(f'/funds/{ fund.ticker.lower() }', container)
+            fund.add_assets(parse_assets(self.__find_inner_html(path_data), self.__find_texts(path_assets)))
+            return True
         
         except Exception as e:
+            self.metrics.failure("assets", e)
             log.warning(f'Unable to get assets of fund { fund.ticker }')
             fund.add_assets({})
+            return False
+
+
+    def is_alive(self) -> bool:
+        # checks if the browser session is still responding
+        if self.browser is None:
+            return True
+
+        try:
+            self.__driver_call("current_url")
+            self.browser.current_url
+            return True
+        except WebDriverException:
+            return False
 
 
     def close(self):
         log.info("Quitting browser instance and closing scraper")
-        self.browser.quit()
+        if self.browser is not None:
+            self.browser.quit()
+        if self.http is not None:
+            self.http.close()
+
+
+def scrape_fund(scraper: Type[FundsExplorerScraper], fund: Type[RealStateFund], chart_url: str = FUNDSEXPLORER_CHART_URL) -> bool:
+    # runs every section scraper over a single fund
+    # returns whether the prices and the fund page were fetched, a page none of the sections could be read from counts as
+    # not fetched (error pages), sections missing from a fetched page are only left empty
+    prices_fetched: bool = scraper.get_funds_prices(fund, chart_url)
+    if scraper.snapshot:
+        scraper.take_snapshot(fund)
+
+    sections: List[bool] = []
+    sections.append(scraper.get_main_indicators(fund, "//section[@id='main-indicators']//span[not(contains(@class, 'indicator-value-unit'))]"))
+    sections.append(scraper.get_basic_info(fund, "//section[@id='basic-infos']//span[contains(@class, 'title') or contains(@class, 'description')]"))
+    sections.append(scraper.get_description(fund, "//section[@id='description']"))
+    sections.append(scraper.get_dividends(fund, path="//div[@id='dividends-chart-wrapper']//script", container="//div[@id='dividends-chart-wrapper']"))
+    sections.append(scraper.get_dividend_yield(fund, path="//div[@id='yields-chart-wrapper']//script", container="//div[@id='yields-chart-wrapper']"))
+    sections.append(scraper.get_equity_value(fund, path="//div[@id='patrimonial-value-chart-wrapper']//script", container="//div[@id='patrimonial-value-chart-wrapper']"))
+    sections.append(scraper.get_vacancy(fund, path="//div[@id='vacancy-chart-wrapper']//script", container="//div[@id='vacancy-chart-wrapper']"))
+    sections.append(scraper.get_assets(fund, path_data="//div[@id='fund-actives-chart']//script", path_assets="//div[@id='fund-actives-items-wrapper']//div[@class='item']", container="//div[@id='fund-actives-items-wrapper']"))
+
+    # every get_* swallows its own errors, so a dead browser would silently leave the fund empty
+    if not scraper.is_alive():
+        raise WebDriverException(f'Browser died while scraping { fund.ticker }')
+
+    if not (prices_fetched and any(sections)):
+        log.warning(f'Fund { fund.ticker } is incomplete (page fetched: { any(sections) }, prices fetched: { prices_fetched })')
+        return False
+    return True
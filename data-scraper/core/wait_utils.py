@@ -0,0 +1,62 @@
+from typing import Dict, List
+import threading
+
+from core.constants import WAIT_ABSENT_GRACE, WAIT_ABSENT_RATIO, WAIT_MIN_OBSERVATIONS
+
+# state of every container in a single round trip: "visible", "present" (in the dom but hidden) or "absent"
+# visibility follows jquery's rule (rendered boxes and not hidden), close to what selenium waits for
+CONTAINERS_STATE_SCRIPT: str = """
+var states = {};
+for (var i = 0; i < arguments[0].length; i++) {
+    var node = document.evaluate(arguments[0][i], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (node === null) {
+        states[arguments[0][i]] = "absent";
+    } else {
+        var visible = node.getClientRects().length > 0 && window.getComputedStyle(node).visibility !== "hidden";
+        states[arguments[0][i]] = visible ? "visible" : "present";
+    }
+}
+return {"ready": document.readyState, "states": states};
+"""
+
+# ready state and rendered text of the document, used for responses shown as plain text like the chart api json
+DOCUMENT_TEXT_SCRIPT: str = """
+return {"ready": document.readyState, "text": document.body === null ? null : document.body.innerText};
+"""
+
+
+class SectionPresence:
+    # learns how often each container is missing from fully loaded pages, shared by every scraper of a pool
+    # containers usually missing (e.g. vacancy charts) are given up as soon as the page is loaded instead of after a grace time
+    def __init__(self, absent_ratio: float = WAIT_ABSENT_RATIO, min_observations: int = WAIT_MIN_OBSERVATIONS,
+                 grace: float = WAIT_ABSENT_GRACE):
+        self.absent_ratio: float = absent_ratio
+        self.min_observations: int = min_observations
+        self.grace: float = grace
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__seen: Dict[str, List[int]] = {} # container: [loaded pages, pages missing it]
+
+
+    def record(self, container: str, present: bool):
+        with self.__lock:
+            seen: List[int] = self.__seen.setdefault(container, [0, 0])
+            seen[0] += 1
+            if not present:
+                seen[1] += 1
+
+
+    def likely_absent(self, container: str) -> bool:
+        with self.__lock:
+            pages, missing = self.__seen.get(container, [0, 0])
+        return pages >= self.min_observations and missing >= self.absent_ratio*pages
+
+
+    def absent_grace(self, container: str) -> float:
+        # seconds a container missing from a loaded page is still waited for
+        return 0 if self.likely_absent(container) else self.grace
+
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        with self.__lock:
+            return {container: {"pages": pages, "missing": missing} for container, (pages, missing) in self.__seen.items()}
@@ -1,10 +1,19 @@
-from typing import Type, List
+from typing import Type, List, Dict, Iterator
 import logging as log
 import os
 import datetime
-from core.constants import FUNDSEXPLORER_BASE_URL, FUNDSEXPLORER_CHART_URL, DATA_FOLDER
+import argparse
+import asyncio
+from core.constants import FUNDSEXPLORER_BASE_URL, DATA_FOLDER, CACHE_FOLDER, PRICES_FOLDER, SCRAPER_WORKERS
 from core.scraping_utils import FundsExplorerScraper
-from core.data_utils import RealStateFund, convert_to_csv
+from core.pool_utils import ScraperPool
+from core.async_scraping_utils import scrape_all_funds
+from core.data_utils import RealStateFund, FundsJournal, CsvFundsWriter, unique_funds
+from core.parquet_utils import ParquetFundsWriter
+from core.cache_utils import ResponseCache
+from core.price_utils import PriceHistoryStore
+from core.metrics_utils import ScraperMetrics
+from core.wait_utils import SectionPresence
 
 print("Program started")
 
@@ -19,33 +28,77 @@ log.basicConfig(filename=logfile,
                     level=log.INFO)
 
 if __name__ == "__main__":
-    scraper: Type[FundsExplorerScraper] = FundsExplorerScraper(FUNDSEXPLORER_BASE_URL)
+    parser = argparse.ArgumentParser(description="Scrapes Real Estate Funds data from fundsexplorer.com.br")
+    parser.add_argument("--workers", type=int, default=SCRAPER_WORKERS, help="number of browser instances scraping in parallel")
+    parser.add_argument("--snapshot", action="store_true", help="load each fund page once and parse every section from its source")
+    parser.add_argument("--backend", choices=["browser", "http"], default="browser", help="http requests pages directly and only renders sections that need it")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="scrape with the asyncio engine (static pages only, no browser)")
+    parser.add_argument("--cache", action="store_true", help="serve unchanged pages and prices from the on-disk cache")
+    parser.add_argument("--incremental", action="store_true", help="request only recent prices and append them to the stored histories")
+    parser.add_argument("--parquet", action="store_true", help="also write the funds as typed parquet tables next to the csv")
+    parser.add_argument("--metrics", action="store_true", help="write a json summary of latencies, navigations, webdriver calls and failures at the end")
+    parser.add_argument("--metrics-port", type=int, default=0, help="also serve live metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--resume", metavar="JOURNAL", default="", help="journal of an interrupted run, only the funds missing from it are scraped")
+    args = parser.parse_args()
 
-    funds_data: List[Type[RealStateFund]] = scraper.get_funds_list("/funds", "//div[@id='fiis-list-container']", "//div[@class='item']")
+    journalname: str = DATA_FOLDER + f'{ datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") } - Funds Journal.jsonl'
+    journal: Type[FundsJournal] = FundsJournal(args.resume if args.resume != "" else os.path.abspath(os.curdir) + journalname)
+    print(f'Journaling scraped funds to { journal.filename }')
 
-    print(f'Found { len(funds_data) } funds')
+    cache: Type[ResponseCache] = ResponseCache(os.path.abspath(os.curdir) + CACHE_FOLDER) if args.cache else None
+    price_store: Type[PriceHistoryStore] = PriceHistoryStore(os.path.abspath(os.curdir) + PRICES_FOLDER) if args.incremental else None
 
-    for index, fund in enumerate(funds_data):
-        log.info("---------------------------------------------")
-        log.info(f'Scraping information about fund { fund.ticker } [{ index+1 }]')
-        print(f'Getting fund { fund.ticker } [{ index+1 }]')
+    # a single metrics object is shared by every scraper, the async engine does not report to it
+    metrics: Type[ScraperMetrics] = ScraperMetrics() if args.metrics or args.metrics_port > 0 else None
+    if args.metrics_port > 0:
+        print(f'Serving metrics on http://127.0.0.1:{ metrics.serve(args.metrics_port) }/metrics')
 
-        scraper.get_funds_prices(fund, FUNDSEXPLORER_CHART_URL)
-        scraper.get_main_indicators(fund, "//section[@id='main-indicators']//span[not(contains(@class, 'indicator-value-unit'))]")
-        scraper.get_basic_info(fund, "//section[@id='basic-infos']//span[contains(@class, 'title') or contains(@class, 'description')]")
-        scraper.get_description(fund, "//section[@id='description']")
-        scraper.get_dividends(fund, path="//div[@id='dividends-chart-wrapper']//script", container="//div[@id='dividends-chart-wrapper']")
-        scraper.get_dividend_yield(fund, path="//div[@id='yields-chart-wrapper']//script", container="//div[@id='yields-chart-wrapper']")
-        scraper.get_equity_value(fund, path="//div[@id='patrimonial-value-chart-wrapper']//script", container="//div[@id='patrimonial-value-chart-wrapper']")
-        scraper.get_vacancy(fund, path="//div[@id='vacancy-chart-wrapper']//script", container="//div[@id='vacancy-chart-wrapper']")
-        scraper.get_assets(fund, path_data="//div[@id='fund-actives-chart']//script", path_assets="//div[@id='fund-actives-items-wrapper']//div[@class='item']", container="//div[@id='fund-actives-items-wrapper']")
+    if args.use_async:
+        funds_data: List[Type[RealStateFund]] = asyncio.get_event_loop().run_until_complete(scrape_all_funds(FUNDSEXPLORER_BASE_URL, journal=journal, cache=cache, price_store=price_store))
 
-    scraper.close()
+    else:
+        # every browser learns from the pages the others loaded which sections are usually missing
+        presence: Type[SectionPresence] = SectionPresence()
+        scraper: Type[FundsExplorerScraper] = FundsExplorerScraper(FUNDSEXPLORER_BASE_URL, backend=args.backend, cache=cache, metrics=metrics, presence=presence)
 
-    print("Writing csv file")
+        funds_data: List[Type[RealStateFund]] = scraper.get_funds_list("/funds", "//div[@id='fiis-list-container']", "//div[@class='item']")
+        # tickers are paired with the scraped funds by position below, every ticker must appear once
+        funds_data = unique_funds(funds_data)
+
+        scraper.close()
+
+        print(f'Found { len(funds_data) } funds')
+
+        finished: Dict[str, Type[RealStateFund]] = journal.load()
+        tickers: List[str] = [fund.ticker for fund in funds_data]
+        print(f'{ len(tickers) - len([ticker for ticker in tickers if ticker not in finished]) } funds already scraped')
+
+        pool: Type[ScraperPool] = ScraperPool(FUNDSEXPLORER_BASE_URL, workers=args.workers, journal=journal, snapshot=args.snapshot, backend=args.backend, cache=cache, price_store=price_store, metrics=metrics, presence=presence)
+        scraped: Iterator[Type[RealStateFund]] = pool.iter_run([fund for fund in funds_data if fund.ticker not in finished])
+        del funds_data # funds are only referenced by the pool until they are written
+
+        # funds are written in the list order as they are scraped, journaled ones are released once written
+        funds_data: Iterator[Type[RealStateFund]] = (finished.pop(ticker) if ticker in finished else next(scraped) for ticker in tickers)
+
+    print("Writing csv file" + (" and parquet tables" if args.parquet else ""))
     csvname: str = DATA_FOLDER + f'{ datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") } - Funds Data.csv'
     csvfile: str = os.path.abspath(os.curdir) + csvname
 
-    convert_to_csv(funds_data, csvfile)
+    writers: list = [CsvFundsWriter(csvfile)]
+    if args.parquet:
+        parquetname: str = DATA_FOLDER + f'{ datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") } - Funds Data/'
+        writers.append(ParquetFundsWriter(os.path.abspath(os.curdir) + parquetname))
+
+    # every fund goes to all the outputs before the next one is scraped
+    for fund in funds_data:
+        for writer in writers:
+            writer.write(fund)
+    for writer in writers:
+        writer.close()
+
+    if metrics is not None:
+        metricsname: str = DATA_FOLDER + f'{ datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") } - Scraping Metrics.json'
+        metrics.dump(os.path.abspath(os.curdir) + metricsname)
+        metrics.stop()
 
     print("Program ended")
\ No newline at end of file
@@ -0,0 +1,51 @@
+# serves pages recorded by the http backend (FundsExplorerScraper(backend="http", record_folder=...)) on localhost
+# so the scraper can be run against them without reaching fundsexplorer.com.br:
+#   python stub-server.py data/recorded --port 8000
+#   python scraping-test.py --backend http --base-url http://localhost:8000 --chart-url "http://localhost:8000/#/cotacoes/?periodo=max"
+
+import os
+import argparse
+import socketserver
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urlparse
+
+from core.http_utils import recorded_file
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RecordedPageHandler(SimpleHTTPRequestHandler):
+    # maps the url to its recorded file the same way HttpFetcher lays them out, pages and chart api are served from one port,
+    # so a request for a host that was not recorded (localhost) is looked up in every recorded host
+    def translate_path(self, path: str) -> str:
+        parsed = urlparse(path)
+        folder: str = self.server.record_folder
+        hosts: list = [self.headers.get("Host", "")] + sorted(os.listdir(folder))
+
+        for host in hosts:
+            filename: str = recorded_file(folder, host, parsed.path, parsed.query)
+            if os.path.isfile(filename):
+                return filename
+
+        return recorded_file(folder, "", parsed.path, parsed.query) # missing, answered with 404
+
+    def guess_type(self, path: str) -> str:
+        if not os.path.isfile(path):
+            return "text/html"
+
+        with open(path, encoding="utf-8") as recorded:
+            return "application/json" if recorded.read(1) in ["{", "["] else "text/html; charset=utf-8"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves recorded fundsexplorer pages")
+    parser.add_argument("record_folder", help="folder written by the http backend record_folder option")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("localhost", args.port), RecordedPageHandler)
+    server.record_folder = os.path.abspath(args.record_folder)
+
+    print(f'Serving { server.record_folder } on http://localhost:{ args.port }')
+    server.serve_forever()
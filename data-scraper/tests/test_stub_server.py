@@ -0,0 +1,162 @@
+# records a fund through the http backend from a local origin, then replays the recording with stub-server.py
+# and checks a pool run during an outage of the origin journals nothing
+#   cd data-scraper && python -m pytest tests
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+import importlib.util
+from http.server import BaseHTTPRequestHandler
+
+SCRAPER_FOLDER: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRAPER_FOLDER)
+
+from core.scraping_utils import FundsExplorerScraper, scrape_fund
+from core.data_utils import RealStateFund, FundsJournal
+from core.pool_utils import ScraperPool
+from core.http_utils import recorded_file
+
+spec = importlib.util.spec_from_file_location("stub_server", os.path.join(SCRAPER_FOLDER, "stub-server.py"))
+stub_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(stub_server)
+
+LIST_PAGE: str = """<html><body><div id="fiis-list-container">
+<div class="item"><span>ABCD11</span><p>Fundo ABCD</p><p>Lajes</p><p>Admin ABCD</p></div>
+</div></body></html>"""
+
+FUND_PAGE: str = """<html><body>
+<section id="main-indicators"><span>Liquidez Diária</span><span>1.000</span><span>Último Rendimento</span><span>R$ 0,50</span></section>
+<section id="basic-infos"><span class="title">Segmento</span><span class="description">Lajes Corporativas</span></section>
+<section id="description"><p>Fundo de lajes corporativas.</p></section>
+<div id="dividends-chart-wrapper"><script>a[b[c["Janeiro/2020","Fevereiro/2020"]d[e[f[0.5,0.6]]</script></div>
+<div id="yields-chart-wrapper"><script>a[b[c["Janeiro/2020","Fevereiro/2020"]d[e[f[0.4,0.45]]</script></div>
+<div id="patrimonial-value-chart-wrapper"><script>a[b[c["Janeiro/2020","Fevereiro/2020"]d[e[101.5,102]]</script></div>
+<div id="vacancy-chart-wrapper"><script>a[b[c["Janeiro/2020"]d[x]e[90]f[10]g[95]h[5]]</script></div>
+<div id="fund-actives-chart"><script>a[b[c["SP"]d[e[100]]</script></div>
+<div id="fund-actives-items-wrapper"><div class="item"><p>Edifício A</p><p>Endereço: Rua 1</p><p>Área: 1000</p></div></div>
+</body></html>"""
+
+PRICES: str = json.dumps({"stockReports": [{"data": "2020-01-02 00:00:00", "fec": 100.5}, {"data": "2020-01-03 00:00:00", "fec": 101}]})
+
+ORIGIN_RESPONSES: dict = {
+    "/funds": ("text/html; charset=utf-8", LIST_PAGE),
+    "/funds/abcd11": ("text/html; charset=utf-8", FUND_PAGE),
+    "/ABCD/cotacoes/?periodo=max": ("application/json", PRICES)
+}
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    # stands for fundsexplorer.com.br and its chart api
+    responses: dict = ORIGIN_RESPONSES
+
+    def do_GET(self):
+        if self.path not in self.responses:
+            self.send_error(404)
+            return
+
+        content_type, body = self.responses[self.path]
+        data: bytes = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(handler, record_folder: str = None):
+    server = stub_server.ThreadingHTTPServer(("localhost", 0), handler)
+    server.record_folder = record_folder
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://localhost:{ server.server_port }'
+
+
+def scrape(base_url: str, record_folder: str = ""):
+    scraper: FundsExplorerScraper = FundsExplorerScraper(base_url, backend="http", record_folder=record_folder)
+    try:
+        funds: list = scraper.get_funds_list("/funds", "//div[@id='fiis-list-container']", "//div[@class='item']")
+        for fund in funds:
+            scrape_fund(scraper, fund, base_url + "/#/cotacoes/?periodo=max")
+    finally:
+        scraper.close()
+    return funds
+
+
+class StubServerTest(unittest.TestCase):
+    def setUp(self):
+        self.record_folder: str = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.record_folder)
+
+    def test_recorded_run_is_replayed(self):
+        origin, origin_url = start_server(OriginHandler)
+        try:
+            recorded: list = scrape(origin_url, self.record_folder)
+        finally:
+            origin.shutdown()
+            origin.server_close()
+
+        # the list page and the fund pages under it are both on disk
+        host: str = origin_url.replace("http://", "")
+        self.assertTrue(os.path.isfile(recorded_file(self.record_folder, host, "/funds")))
+        self.assertTrue(os.path.isfile(recorded_file(self.record_folder, host, "/funds/abcd11")))
+        self.assertTrue(os.path.isfile(recorded_file(self.record_folder, host, "/ABCD/cotacoes/", "periodo=max")))
+
+        stub, stub_url = start_server(stub_server.RecordedPageHandler, self.record_folder)
+        try:
+            replayed: list = scrape(stub_url)
+        finally:
+            stub.shutdown()
+            stub.server_close()
+
+        self.assertEqual([fund.ticker for fund in replayed], ["ABCD11"])
+        fund: RealStateFund = replayed[0]
+        self.assertEqual(fund.admin, "Admin ABCD")
+        self.assertEqual(fund.indicators, {"Liquidez Diária": "1.000", "Último Rendimento": "R$ 0,50"})
+        self.assertEqual(fund.basic_info, {"Segmento": "Lajes Corporativas"})
+        self.assertEqual(fund.description, "Fundo de lajes corporativas.")
+        self.assertEqual(fund.prices.to_records(), json.loads(PRICES)["stockReports"])
+        self.assertEqual(fund.dividends.to_records(), [["Janeiro/2020", "Fevereiro/2020"], [0.5, 0.6]])
+        self.assertEqual(fund.equity_value.to_records(), [["Janeiro/2020", "Fevereiro/2020"], [101.5, 102]])
+        self.assertEqual(fund.vacancy.to_records()["Vacância Física"], [10])
+        self.assertEqual(fund.assets["Assets"], {"Edifício A": {"Endereço": " Rua 1", "Área": " 1000"}})
+
+        self.assertEqual(fund.to_dict(), recorded[0].to_dict())
+
+
+class OutageHandler(OriginHandler):
+    # only the funds list is served, fund pages and prices answer 404
+    responses: dict = {"/funds": ORIGIN_RESPONSES["/funds"]}
+
+
+class PoolJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.journal_folder: str = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_folder)
+
+    def test_incomplete_funds_are_not_journaled(self):
+        origin, origin_url = start_server(OutageHandler)
+        try:
+            journal: FundsJournal = FundsJournal(os.path.join(self.journal_folder, "journal.jsonl"))
+            funds: list = [RealStateFund(ticker, "", "") for ticker in ["ABCD11", "EFGH11"]]
+            pool: ScraperPool = ScraperPool(origin_url, workers=1, max_attempts=2, journal=journal, backend="http")
+            scraped: list = list(pool.iter_run(funds))
+        finally:
+            origin.shutdown()
+            origin.server_close()
+
+        self.assertEqual([fund.ticker for fund in scraped], ["ABCD11", "EFGH11"])
+        self.assertEqual(journal.load(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import platform
+import tracemalloc
+import datetime as dt
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+import utils as u
+
+columns = [
+    "Ticker", "Nome", "Administrador", "Descrição", "Data de Constituição do Fundo", "Cotas Emitidas", "Tipo de Gestão", "Público Alvo",
+    "Mandato", "Segmento", "Prazo de Duração", "Taxa de Administração", "Taxa de Performance", "Ativos Atuais", "Liquidez Diária",
+    "Patrimônio Líquido", "Cotações Históricas", "Dividendos Históricos", "Dividend Yield Histórico", "Valor Patrimonial Histórico",
+    "Vacância Histórica"
+]
+vacancy_columns = ["Ocupação Física", "Vacância Física", "Ocupação Financeira", "Vacância Financeira"]
+
+admins = ["BTG Pactual", "Rio Bravo", "Vórtx", "XP Investimentos", "Kinea", "Credit Suisse", "Oliveira Trust", "BRL Trust"]
+segments = ["Lajes Corporativas", "Shoppings", "Logística", "Híbrido", "Títulos e Val. Mob.", "Hospital", "Residencial"]
+words = ["fundo", "imobiliário", "investimento", "renda", "aluguel", "imóveis", "cotas", "shopping", "galpões", "logístico",
+         "escritórios", "contratos", "locação", "atípicos", "CRI", "recebíveis", "gestão", "ativa", "passiva", "São", "Paulo"]
+ufs = ['AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG',
+       'PA', 'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO']
+
+cat_columns = ['Administrador', 'Tipo de Gestão', 'Público Alvo', 'Mandato', 'Segmento', 'Prazo de Duração']
+text_columns = ['Descrição', 'Taxa de Administração']
+
+def _month_starts(end, months):
+    return (np.datetime64(end, 'M') - np.arange(months)).astype("datetime64[us]").tolist()
+
+def _description(rng):
+    text = ' '.join(rng.choice(words, size=rng.randint(20, 80)))
+    return ("DESCRIÇÃO" if rng.rand() < 0.5 else "") + text.capitalize() + ". (Fonte: CVM) - Atualizado;"
+
+# one synthetic fund shaped like a row of data-processing's funds.pkl
+def make_fund(rng, index, years, end, missing):
+    n_days = int(years*365)
+    n_months = int(years*12)
+    maybe = lambda value: None if rng.rand() < missing else value
+
+    days = np.datetime64(end, 'D') - np.arange(n_days)
+    business_days = days[np.is_busday(days)].astype("datetime64[us]")
+    prices = np.round(100*np.exp(np.cumsum(rng.normal(0, 0.01, len(business_days)))), 2)
+
+    months = _month_starts(end, n_months)
+    dividends = np.round(rng.uniform(0.3, 1.2, n_months), 2)
+    equity = np.round(95 + np.cumsum(rng.normal(0, 0.5, n_months)), 2)
+    vacancy = np.round(rng.uniform(0, 25, len(months[::3])), 1)
+
+    fund_ufs = list(rng.choice(ufs, size=rng.randint(1, 5), replace=False))
+    areas = list(np.round(rng.dirichlet(np.ones(len(fund_ufs)))*100, 1))
+
+    return [
+        f'FUND{ index:05d}11', f'Fundo { index }', rng.choice(admins), maybe(_description(rng)),
+        pd.Timestamp(end) - pd.Timedelta(days=int(rng.randint(n_days, 6000))), maybe(float(rng.randint(10**5, 10**8))),
+        maybe(rng.choice(["Ativa", "Passiva"])), rng.choice(["Geral", "Investidor Qualificado"]),
+        rng.choice(["Renda", "Títulos e Valores Mobiliários", "Desenvolvimento para Renda"]), rng.choice(segments), "Indeterminado",
+        maybe(f'{ rng.uniform(0.2, 1.5):.2f}% a.a.'.replace('.', ',', 1)), None,
+        maybe({'Assets': {f'Imóvel { index }-{ n }': {'Endereço': f'Rua { n }', 'Área': str(area)} for n, area in enumerate(areas)},
+               'Location': [fund_ufs, areas]}),
+        maybe(float(rng.randint(100, 10**5))), maybe(float(rng.randint(10**7, 10**9))),
+        maybe([business_days.tolist()[::-1], list(prices[::-1])]),
+        maybe([months, list(dividends)]),
+        maybe([months, list(np.round(dividends/prices[0]*100, 4))]),
+        maybe([months, list(equity)]),
+        maybe(dict({'date': months[::3]}, **{
+            column: list(100 - vacancy if column.startswith("Ocupação") else vacancy) for column in vacancy_columns
+        }))
+    ]
+
+# funds.pkl-shaped frame: years of daily prices, monthly dividends, yields and equity, quarterly vacancy dicts, asset locations
+# each optional cell is None with probability missing, the same seed always gives the same frame
+def make_funds(n_funds, years=2, end='2020-12-31', missing=0.02, seed=42):
+    rng = np.random.RandomState(seed)
+    rows = [make_fund(rng, index, years, end, missing) for index in range(n_funds)]
+    return pd.DataFrame(rows, columns=columns)
+
+# the modelling notebook pipeline plus the encoding of the text columns
+def pipeline_steps():
+    return [
+        ('clean-description-headers', u.CleanHeaders(col=3)),
+        ('clean-description-punct', u.CleanPunct(col=3)),
+        ('input-const-admin-tax', u.FillColumn(col=11, method='const', const='0,2% a.a.')),
+        ('clean-admin-tax-headers', u.CleanHeaders(col=11)),
+        ('clean-admin-tax-punct', u.CleanPunct(col=11)),
+        ('input-foundation-date', u.InputDate(col=4, ref_col=16)),
+        ('input-mean-daily-liquidity', u.FillColumn(col=14, method='median')),
+        ('process-dividends', u.ProcessDividends(col=17)),
+        ('process-prices', u.ProcessPrices(col=16)),
+        ('process-equity', u.ProcessEquity(col=19)),
+        ('standard-scaler', u.StdScaler(exclude_col=['Div. Acum. Últ. Trimestre', 'Data de Constituição do Fundo'])),
+        ('process-vacancy', u.ProcessVacancy(col=20)),
+        ('process-assets', u.ProcessAssets(col=13)),
+        ('input-empty-description', u.FillColumn(col=3, method='const', const='')),
+        ('text-encoding', u.CountVectorizer2(col=text_columns, sparse_output=True)),
+        ('drop-columns', u.DropColumns(cols=["Taxa de Performance", "Ativos Atuais", "Cotações Históricas",
+                                             "Dividendos Históricos", "Dividend Yield Histórico", "Nome",
+                                             "Valor Patrimonial Histórico", "Vacância Histórica", "Div. M-0", "Div. M-1",
+                                             "Div. M-2", "Preços Média M-0", "Preços Média M-1", "Preços Média M-2",
+                                             "Val. Patr. M-0", "Val. Patr. M-1", "Val. Patr. M-2", "Vacância M-0",
+                                             "Vacância M-1", "Vacância M-2", "Ticker", "Data de Constituição do Fundo"])),
+        ('drop-rows', u.DropRows(rows='all')),
+        ('cat-encoding', u.OneHotEncoder2(col=cat_columns)),
+        ('convert-available2float', u.Convert2Float())
+    ]
+
+def _run_steps(funds, memory):
+    # fit_transform of every step in order, timed or with its peak traced memory
+    results = []
+    X = funds.copy()
+    for name, step in pipeline_steps():
+        rows = len(X)
+        if memory:
+            tracemalloc.start()
+        t1 = default_timer()
+        X = step.fit_transform(X)
+        t2 = default_timer()
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results.append({'step': name, 'seconds': t2 - t1, 'rows': rows, 'peak_mb': peak/2**20 if memory else None})
+    return results
+
+# times every step and the whole pipeline over a frame, the memory pass runs apart so tracing does not skew the timings
+def benchmark(funds, repeat=3, memory=True):
+    runs = [_run_steps(funds, memory=False) for _ in range(repeat)]
+    steps = []
+    for index, first in enumerate(runs[0]):
+        seconds = min([run[index]['seconds'] for run in runs])
+        steps.append({'step': first['step'], 'seconds': seconds, 'funds_per_second': first['rows']/seconds if seconds > 0 else None})
+
+    if memory:
+        for step, traced in zip(steps, _run_steps(funds, memory=True)):
+            step['peak_mb'] = traced['peak_mb']
+
+    total = min([sum([step['seconds'] for step in run]) for run in runs])
+    return {
+        'funds': len(funds), 'seconds': total, 'funds_per_second': len(funds)/total,
+        'peak_mb': max([step['peak_mb'] for step in steps]) if memory else None, 'steps': steps
+    }
+
+def environment():
+    return {
+        'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__,
+        'pandas': pd.__version__, 'sklearn': sklearn.__version__
+    }
+
+def run_benchmarks(sizes=(100, 1000, 10000), years=2, repeat=3, memory=True, seed=42):
+    results = {'created': dt.datetime.now().isoformat(timespec='seconds'), 'years': years, 'seed': seed,
+               'environment': environment(), 'sizes': []}
+    for size in sizes:
+        print(f'Generating { size } funds')
+        funds = make_funds(size, years=years, seed=seed)
+        print(f'Benchmarking { size } funds')
+        result = benchmark(funds, repeat=repeat, memory=memory)
+        print(format_result(result))
+        results['sizes'].append(result)
+    return results
+
+def format_result(result):
+    lines = [f"{ result['funds'] } funds: { result['seconds']:.3f} s, { result['funds_per_second']:.1f} funds/s"]
+    for step in result['steps']:
+        memory = f"{ step['peak_mb']:9.1f} MB" if step.get('peak_mb') is not None else ''
+        lines.append(f"  { step['step']:30} { step['seconds']:9.4f} s { memory }")
+    return '\n'.join(lines)
+
+def save_results(results, folder):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"benchmark-{ results['created'].replace(':', '') }.json")
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(results, results_file, indent=2, ensure_ascii=False)
+    return path
+
+def load_results(path):
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)
+
+# time ratios current/previous of every step measured in both, above 1 means slower now
+def compare_results(previous, current):
+    rows = []
+    for old in previous['sizes']:
+        new = next((size for size in current['sizes'] if size['funds'] == old['funds']), None)
+        if new is None:
+            continue
+        old_steps = {step['step']: step for step in old['steps']}
+        for step in new['steps'] + [{'step': 'pipeline', 'seconds': new['seconds']}]:
+            old_step = old_steps.get(step['step'], {'seconds': old['seconds']} if step['step'] == 'pipeline' else None)
+            if old_step is not None:
+                rows.append({'funds': old['funds'], 'step': step['step'], 'previous': old_step['seconds'],
+                             'current': step['seconds'], 'ratio': step['seconds']/old_step['seconds']})
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the transformers of the modelling pipeline over synthetic funds")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="numbers of funds")
+    parser.add_argument("--years", type=float, default=2, help="years of history of every fund")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs of each size, the fastest one is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak memory pass")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"),
+                        help="folder of the results json")
+    parser.add_argument("--compare", default=None, help="previous results json to compare with")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, years=args.years, repeat=args.repeat, memory=not args.no_memory)
+    print(f'Results saved to { save_results(results, args.output) }')
+
+    if args.compare is not None:
+        comparison = compare_results(load_results(args.compare), results)
+        if len(comparison) == 0:
+            print(f'No fund count in common with { args.compare }')
+        else:
+            print(comparison.to_string(index=False))
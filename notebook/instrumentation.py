@@ -0,0 +1,127 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline
+
+def _shape(X):
+    shape = getattr(X, 'shape', (len(X),))
+    return shape[0], shape[1] if len(shape) > 1 else 1
+
+def _memory(X, deep):
+    # bytes held by X, deep adds the python objects of object columns (their own size, not what lists and dicts hold)
+    if isinstance(X, pd.DataFrame):
+        return int(X.memory_usage(index=True, deep=deep).sum())
+    if isinstance(X, np.ndarray):
+        return X.nbytes
+    if hasattr(X, 'data') and hasattr(X.data, 'nbytes'): # scipy sparse matrices
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return None
+
+def _dtypes(X):
+    if isinstance(X, pd.DataFrame):
+        return {str(column): str(dtype) for column, dtype in X.dtypes.items()}
+    return {}
+
+# runs a transformer and records what each call did: wall and cpu time, rows, columns, memory and the dtypes it changed
+class InstrumentedStep(BaseEstimator, TransformerMixin):
+    def __init__(self, step, name, profiler):
+        self.step = step
+        self.name = name
+        self.profiler = profiler
+
+    def __sklearn_is_fitted__(self):
+        return True
+
+    def _call(self, method, X, *args, **kwargs):
+        rows_in, cols_in = _shape(X)
+        memory_in = _memory(X, self.profiler.deep_memory)
+        dtypes_in = _dtypes(X)
+
+        profile = cProfile.Profile() if self.name == self.profiler.profile_step else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            result = getattr(self.step, method)(X, *args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+        if profile is not None:
+            self.profiler.profiles.append((self.name, method, profile))
+
+        output = X if method == 'fit' else result
+        rows_out, cols_out = _shape(output)
+        dtypes_out = _dtypes(output)
+        self.profiler.records.append({
+            'step': self.name, 'transformer': type(self.step).__name__, 'method': method,
+            'wall_time': wall, 'cpu_time': cpu, 'rows_in': rows_in, 'rows_out': rows_out, 'cols_in': cols_in, 'cols_out': cols_out,
+            'memory_in': memory_in, 'memory_out': _memory(output, self.profiler.deep_memory),
+            'dtype_changes': {
+                column: [dtype, dtypes_out[column]] for column, dtype in dtypes_in.items()
+                if column in dtypes_out and dtypes_out[column] != dtype
+            },
+            'cols_added': len([column for column in dtypes_out if column not in dtypes_in]),
+            'cols_removed': len([column for column in dtypes_in if column not in dtypes_out])
+        })
+        return result
+
+    def fit(self, X, y=None, **fit_params):
+        self._call('fit', X, y, **fit_params)
+        return self
+
+    def transform(self, X, y=None):
+        return self._call('transform', X)
+
+    def fit_transform(self, X, y=None, **fit_params):
+        return self._call('fit_transform', X, y, **fit_params)
+
+# collects the records of every instrumented step, disabled it hands the pipeline back untouched so it costs nothing
+# profile_step names the one step run under cProfile, deep_memory also counts the objects of object columns (slower)
+class PipelineProfiler:
+    def __init__(self, enabled=True, profile_step=None, deep_memory=True):
+        self.enabled = enabled
+        self.profile_step = profile_step
+        self.deep_memory = deep_memory
+        self.records = []
+        self.profiles = []
+
+    def instrument(self, pipeline):
+        if not self.enabled:
+            return pipeline
+        return Pipeline([(name, InstrumentedStep(step, name, self)) for name, step in pipeline.steps])
+
+    def reset(self):
+        self.records = []
+        self.profiles = []
+
+    def to_frame(self):
+        frame = pd.DataFrame(self.records)
+        if len(frame) == 0:
+            return frame
+        frame['dtype_changes'] = frame['dtype_changes'].apply(len)
+        for column in ['memory_in', 'memory_out']:
+            frame[column] = frame[column]/2**20 # MB
+        return frame.rename(columns={'memory_in': 'memory_in_mb', 'memory_out': 'memory_out_mb'})
+
+    def to_json(self, path=None):
+        text = json.dumps(self.records, indent=2, ensure_ascii=False)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as json_file:
+                json_file.write(text)
+        return text
+
+    def profile_stats(self, sort='cumulative', limit=30):
+        # cProfile report of the profiled step, one block per call
+        output = io.StringIO()
+        for name, method, profile in self.profiles:
+            output.write(f'--- { name } ({ method })\n')
+            pstats.Stats(profile, stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
@@ -0,0 +1,107 @@
+import json
+import os
+import datetime as dt
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import GridSearchCV
+
+import utils as u
+
+try:
+    from sklearn.experimental import enable_halving_search_cv # noqa, enables the import below
+    from sklearn.model_selection import HalvingGridSearchCV
+except ImportError:
+    HalvingGridSearchCV = None # scikit-learn < 0.24, searches fall back to a full grid
+
+# the transformed frame as one float matrix (csr when it has sparse columns): the pipeline runs once and every fold and
+# candidate reads the same matrix, joblib memory-maps it for the workers instead of copying it
+def feature_matrix(X):
+    if any([isinstance(dtype, pd.SparseDtype) for dtype in X.dtypes]):
+        return u.to_csr(X)[0]
+    return np.ascontiguousarray(X.to_numpy(dtype=float))
+
+def label_vector(y):
+    return np.asarray(y, dtype=float).ravel()
+
+# successive halving gives every candidate a small budget (resource) and only the best 1/factor go on to a bigger one
+def make_search(estimator, param_grid, method='halving', cv=10, scoring='neg_mean_squared_error', n_jobs=-1, factor=3,
+                resource='n_samples', random_state=None):
+    if method == 'halving' and HalvingGridSearchCV is None:
+        print("HalvingGridSearchCV not available, running a full grid search")
+        method = 'grid'
+
+    if method == 'halving':
+        return HalvingGridSearchCV(estimator, param_grid, cv=cv, scoring=scoring, n_jobs=n_jobs, factor=factor,
+                                   resource=resource, return_train_score=True, random_state=random_state)
+    elif method == 'grid':
+        return GridSearchCV(estimator, param_grid, cv=cv, scoring=scoring, n_jobs=n_jobs, return_train_score=True)
+
+    raise ValueError(f"Unknown search method '{ method }'")
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def _candidate_records(search, run):
+    results = search.cv_results_
+    records = []
+    for index, params in enumerate(results['params']):
+        record = {
+            'run': run, 'record': 'candidate', 'params': params,
+            'iter': results['iter'][index] if 'iter' in results else 0,
+            'n_resources': results['n_resources'][index] if 'n_resources' in results else None,
+            'mean_fit_time': results['mean_fit_time'][index], 'std_fit_time': results['std_fit_time'][index],
+            'mean_score_time': results['mean_score_time'][index], 'std_score_time': results['std_score_time'][index],
+            'mean_test_score': results['mean_test_score'][index], 'std_test_score': results['std_test_score'][index],
+            'mean_train_score': results['mean_train_score'][index], 'rank_test_score': results['rank_test_score'][index]
+        }
+        records.append(record)
+    return records
+
+def write_log(records, log_path):
+    folder = os.path.dirname(log_path)
+    if folder != '':
+        os.makedirs(folder, exist_ok=True)
+    with open(log_path, 'a', encoding='utf-8') as log_file:
+        for record in records:
+            log_file.write(json.dumps(record, default=_json_default, ensure_ascii=False) + '\n')
+
+# runs one search over an already transformed feature matrix, the timings of every candidate and of the whole search are
+# appended to log_path (one json per line) under the run name, so configurations can be compared across runs
+def run_search(estimator, param_grid, X, y, name=None, method='halving', cv=10, scoring='neg_mean_squared_error', n_jobs=-1,
+               factor=3, resource='n_samples', random_state=None, log_path=None):
+    X_matrix = X if isinstance(X, np.ndarray) or u.sp.sparse.issparse(X) else feature_matrix(X)
+    y_vector = label_vector(y)
+
+    search = make_search(estimator, param_grid, method=method, cv=cv, scoring=scoring, n_jobs=n_jobs, factor=factor,
+                         resource=resource, random_state=random_state)
+    method = 'halving' if HalvingGridSearchCV is not None and isinstance(search, HalvingGridSearchCV) else 'grid'
+
+    t1 = default_timer()
+    search.fit(X_matrix, y_vector)
+    t2 = default_timer()
+
+    run = name if name is not None else f'{ type(estimator).__name__ }-{ dt.datetime.now().strftime("%Y%m%d-%H%M%S") }'
+    summary = {
+        'run': run, 'record': 'search', 'estimator': type(estimator).__name__, 'method': method, 'cv': cv,
+        'scoring': scoring, 'n_jobs': n_jobs, 'n_samples': X_matrix.shape[0], 'n_features': X_matrix.shape[1],
+        'n_candidates': len(search.cv_results_['params']), 'wall_time': t2 - t1,
+        # every row of cv_results_ (a candidate in one halving iteration) is fitted on n_splits_ folds
+        'fit_time': float(np.sum(search.cv_results_['mean_fit_time'])*search.n_splits_),
+        'best_params': search.best_params_, 'best_score': search.best_score_, 'refit_time': getattr(search, 'refit_time_', None)
+    }
+    print(f"Tempo gasto: { summary['wall_time']:.2f} s ({ summary['n_candidates'] } candidatos, { method })")
+
+    if log_path is not None:
+        write_log(_candidate_records(search, run) + [summary], log_path)
+
+    return search
+
+# the search records of a log, one row per run, to compare wall-clock cost and score across configurations
+def load_runs(log_path, record='search'):
+    with open(log_path, encoding='utf-8') as log_file:
+        records = [json.loads(line) for line in log_file if line.strip() != '']
+    return pd.DataFrame([entry for entry in records if entry['record'] == record])
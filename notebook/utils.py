@@ -1,8 +1,15 @@
 import pandas as pd
 import numpy as np
 import scipy as sp
+import scipy.sparse
 import string
 import datetime as dt
+import os
+import json
+import joblib
+import hashlib
+import pickle
+import time
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import OneHotEncoder as SKLOneHotEncoder
 from sklearn.preprocessing import StandardScaler as SKLStdScaler
@@ -18,8 +25,163 @@ class CategoryManager:
     def __str__(self):
         print(self.categories)
 
+# history column of a funds dataset, memory-mapped dates/values arrays sliced by the per-fund offsets
+class SeriesColumn:
+    def __init__(self, dates, values, offsets, value_columns=None):
+        self.dates = dates
+        self.values = values
+        self.offsets = offsets
+        self.value_columns = value_columns # names of the values columns for multi-valued series (vacancy)
+
+    @staticmethod
+    def load(folder, name, value_columns=None):
+        dates = np.load(os.path.join(folder, name + ".dates.npy"), mmap_mode="r")
+        values = np.load(os.path.join(folder, name + ".values.npy"), mmap_mode="r")
+        return SeriesColumn(dates, values, np.load(os.path.join(folder, name + ".offsets.npy")), value_columns)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        # (dates, values) views of a fund history
+        start, end = self.offsets[row], self.offsets[row+1]
+        return self.dates[start:end], self.values[start:end]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def views(self):
+        # (dates, values) views of every fund, None where the history is missing
+        return [self[row] if length > 0 else None for row, length in enumerate(self.lengths().tolist())]
+
+    def take(self, rows):
+        # histories of the given funds gathered into contiguous in-memory arrays, in the order of rows
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.lengths()[rows]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        positions = np.repeat(self.offsets[rows] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return SeriesColumn(self.dates[positions], self.values[positions], offsets, self.value_columns)
+
+    def column(self, name):
+        # values of one of the value columns, the values themselves for single-valued series
+        return self.values if self.value_columns is None else self.values[:, self.value_columns.index(name)]
+
+    def cell(self, row):
+        # history in the funds.pkl shape: [dates, values] or the vacancy dict, None when missing
+        dates, values = self[row]
+        if len(dates) == 0:
+            return None
+
+        dates = dates.astype("datetime64[us]").tolist()
+        if self.value_columns is None:
+            return [dates, values.tolist()]
+        return dict({"date": dates}, **{column: values[:, index].tolist() for index, column in enumerate(self.value_columns)})
+
+# processed funds written by data-processing/main.py --format dataset, columns are only read when asked for
+class FundsDataset:
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, "dataset.json"), encoding="utf-8") as meta_file:
+            self.meta = json.load(meta_file)
+        self.columns = self.meta["columns"]
+        self._loaded = {}
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def __getitem__(self, column):
+        # pd.Series for scalar columns, SeriesColumn for histories and a list of dicts for the assets
+        if column not in self._loaded:
+            if column in self.meta["series"]:
+                value_columns = self.meta["vacancy_columns"] if column == "Vacância Histórica" else None
+                self._loaded[column] = SeriesColumn.load(self.folder, self.meta["series"][column], value_columns)
+            elif column == "Ativos Atuais":
+                with open(os.path.join(self.folder, "assets.json"), encoding="utf-8") as assets_file:
+                    self._loaded[column] = json.load(assets_file)
+            elif column in self.meta["scalars"]:
+                self._loaded[column] = pd.read_parquet(os.path.join(self.folder, "scalars.parquet"), columns=[column])[column]
+            else:
+                raise KeyError(column)
+
+        return self._loaded[column]
+
+    def __getstate__(self):
+        # columns are read again after unpickling, a pipeline holding the dataset does not save its arrays
+        state = dict(vars(self))
+        state['_loaded'] = {}
+        return state
+
+    def to_frame(self, columns=None, lazy=False):
+        # funds.pkl compatible frame in the funds.pkl column order, with every column the default positions of the transformers hold
+        # lazy frames hold the dataset row of each fund in the history columns instead of the history, for the transformers
+        # given the dataset (see history_column) to read the arrays straight away
+        columns = [column for column in self.columns if columns is None or column in columns]
+        data = {}
+        for column in columns:
+            loaded = self[column]
+            if isinstance(loaded, SeriesColumn) and lazy:
+                data[column] = np.arange(len(loaded))
+            elif isinstance(loaded, SeriesColumn):
+                data[column] = [loaded.cell(row) for row in range(len(loaded))]
+            elif isinstance(loaded, list):
+                data[column] = loaded
+            else:
+                data[column] = loaded.tolist()
+
+        return pd.DataFrame(data, columns=columns)
+
+# history column col_index of X: its cells, or the SeriesColumn of the funds when X is a lazy frame of dataset
+def history_column(X, col_index, dataset=None):
+    if dataset is None:
+        return X.iloc[:,col_index]
+    return dataset[X.columns[col_index]].take(X.iloc[:,col_index].to_numpy(dtype=np.int64))
+
+# joins new feature columns to X as one preallocated float64 block, X keeps its dtypes and is copied once
+def join_features(X, names, columns):
+    block = np.empty((len(X), len(names)))
+    for index, column in enumerate(columns):
+        block[:, index] = np.array(column, dtype=float) # None becomes NaN
+    return pd.concat([X.reset_index(drop=True), pd.DataFrame(block, columns=names)], axis=1)
+
+# frame of sparse columns filled with zeros, built straight from the non-zeros of matrix
+def sparse_frame(matrix, names):
+    matrix = sp.sparse.csc_matrix(matrix, dtype=float)
+    matrix.sort_indices()
+    n_rows, indptr = matrix.shape[0], matrix.indptr
+
+    columns = []
+    for index in range(matrix.shape[1]):
+        start, end = indptr[index], indptr[index+1]
+        column = sp.sparse.csc_matrix((matrix.data[start:end], matrix.indices[start:end], [0, end-start]), shape=(n_rows, 1))
+        columns.append(pd.arrays.SparseArray.from_spmatrix(column))
+    return pd.DataFrame(dict(zip(range(len(columns)), columns)), index=range(matrix.shape[0])).set_axis(names, axis=1)
+
+# joins new sparse feature columns to X, memory follows the non-zeros of matrix instead of its shape
+def join_sparse_features(X, names, matrix):
+    return pd.concat([X.reset_index(drop=True), sparse_frame(matrix, names)], axis=1)
+
+# X as a csr matrix and its column names, every column must be numeric
+def to_csr(X):
+    is_sparse = np.array([isinstance(dtype, pd.SparseDtype) for dtype in X.dtypes], dtype=bool)
+    dense_cols = X.columns[~is_sparse]
+    sparse_cols = X.columns[is_sparse]
+
+    blocks = [sp.sparse.csr_matrix(X[dense_cols].to_numpy(dtype=float))]
+    if len(sparse_cols) > 0:
+        blocks.append(X[sparse_cols].sparse.to_coo())
+    matrix = sp.sparse.hstack(blocks, format='csr')
+
+    # back to the column order of X
+    order = np.argsort(np.concatenate([np.flatnonzero(~is_sparse), np.flatnonzero(is_sparse)]))
+    return matrix[:, order], list(X.columns)
+
+# transformers that learn nothing in fit, a pipeline ending in one of them can transform without being refitted
+class StatelessMixin:
+    def __sklearn_is_fitted__(self):
+        return True
+
 # drop rows
-class DropRows(BaseEstimator, TransformerMixin):
+class DropRows(StatelessMixin, BaseEstimator, TransformerMixin):
     def __init__(self, rows=["Cotas Emitidas", "Tipo de Gestão",
                         "Público Alvo", "Mandato", "Segmento",
                         "Patrimônio Líquido", "Descrição"]):
@@ -36,7 +198,7 @@ class DropRows(BaseEstimator, TransformerMixin):
         return X.dropna(subset=rows).reset_index(drop=True)
 
 # drop ticker row
-class DropTickerAndName(BaseEstimator, TransformerMixin):
+class DropTickerAndName(StatelessMixin, BaseEstimator, TransformerMixin):
     def __init__(self, category_manager, cols=['Ticker', 'Nome']):
         self.cols = cols
         self.category_manager = category_manager
@@ -50,7 +212,7 @@ class DropTickerAndName(BaseEstimator, TransformerMixin):
         return X.drop(columns=self.cols)
 
 # drop columns
-class DropColumns(BaseEstimator, TransformerMixin):
+class DropColumns(StatelessMixin, BaseEstimator, TransformerMixin):
     def __init__(self, cols):
         self.cols = cols
 
@@ -61,7 +223,7 @@ class DropColumns(BaseEstimator, TransformerMixin):
         return X.drop(columns=self.cols)
 
 # convert columns to float
-class Convert2Float(BaseEstimator, TransformerMixin):
+class Convert2Float(StatelessMixin, BaseEstimator, TransformerMixin):
     def __init__(self, skip=[]):
         self.skip_col = skip
 
@@ -73,6 +235,8 @@ class Convert2Float(BaseEstimator, TransformerMixin):
         columns = X.columns
         for column in columns:
             if not column in self.skip_col:
+                if pd.api.types.is_numeric_dtype(X[column]):
+                    continue # features are already float64 blocks
                 try:
                     X[column] = X[column].astype(float)
                 except ValueError:
@@ -89,27 +253,35 @@ class StdScaler(BaseEstimator, TransformerMixin):
     def __init__(self, exclude_col = []):
         self.exclude_col = exclude_col
 
-    def fit(self, x, y=None):
+    # learns mean and std of every numeric column at once, transform only applies them
+    def fit(self, X, y=None):
         print("\nRunning Std. Scaler")
-        return self
-
-    def transform(self, X, y=None):
-        columns = X.columns
-        for column in columns:
+        self.columns_ = []
+        for column in X.columns:
             if column in self.exclude_col:
                 print(f'Skipping { column }')
             else:
                 try:
-                    X[column] = SKLStdScaler().fit_transform(np.array(X[column]).reshape(-1,1))
+                    X[[column]].to_numpy(dtype=float)
+                    self.columns_.append(column)
                 except ValueError:
                     print(f"Unable to std. scale '{ column }'")
                 except TypeError:
                     print(f"Unable to std. scale '{ column }'")
 
+        self.scaler_ = SKLStdScaler()
+        if len(self.columns_) > 0:
+            self.scaler_.fit(X[self.columns_].to_numpy(dtype=float))
+        return self
+
+    def transform(self, X, y=None):
+        if len(self.columns_) > 0:
+            X[self.columns_] = self.scaler_.transform(X[self.columns_].to_numpy(dtype=float))
+
         return X
 
 # remove title
-class CleanHeaders(BaseEstimator, TransformerMixin):
+class CleanHeaders(StatelessMixin, BaseEstimator, TransformerMixin):
     def __init__(self, col):
         self.col_index = col
     
@@ -132,7 +304,7 @@ class CleanHeaders(BaseEstimator, TransformerMixin):
         return X
 
 # remove punctuation   
-class CleanPunct(BaseEstimator, TransformerMixin):    
+class CleanPunct(StatelessMixin, BaseEstimator, TransformerMixin):    
     def __init__(self, col):
         self.table_punct = str.maketrans({key: " " for key in string.punctuation.replace("$","").replace("%", "") + ' \t\n\r\f\v–'})
         self.col_index = col
@@ -160,79 +332,95 @@ class OneHotEncoder(BaseEstimator, TransformerMixin):
         self.target_cols_names = col
         self.category_manager = category_manager
 
-    def fit(self, x, y=None):
+    def fit(self, X, y=None):
+        self.encoders_ = {}
+        for col in self.target_cols_names:
+            self.encoders_[col] = SKLOneHotEncoder(categories='auto', handle_unknown='ignore').fit(X[[col]])
+            self.category_manager.add_category(group_name=col, categories=list(self.encoders_[col].categories_[0]))
         return self
 
     def transform(self, X, y=None):
         for col in self.target_cols_names:
-            encoder = SKLOneHotEncoder(categories='auto')
-
-            X[col] = encoder.fit_transform(X[[col]])
-            self.category_manager.add_category(group_name=col, categories=list(encoder.categories_[0]))
+            X[col] = self.encoders_[col].transform(X[[col]])
 
         return X
 
 class OneHotEncoder2(BaseEstimator, TransformerMixin):
-    def __init__(self, col):
+    def __init__(self, col, sparse_output=False):
         self.target_cols_names = col
+        self.sparse_output = sparse_output
 
-    def fit(self, x, y=None):
+    # categories never seen in fit are encoded as all zeros
+    def fit(self, X, y=None):
+        self.encoder_ = SKLOneHotEncoder(categories='auto', handle_unknown='ignore').fit(X[self.target_cols_names])
+        self.labels_ = list(np.concatenate(self.encoder_.categories_).ravel())
         return self
 
     def transform(self, X, y=None):
-        encoder = SKLOneHotEncoder(categories='auto')
-
         selected_cols = X[self.target_cols_names]
         remaining_cols = X.drop(columns=self.target_cols_names)
 
-        selected_cols_encoded = encoder.fit_transform(selected_cols).toarray()
-        labels = np.concatenate(encoder.categories_).ravel()
+        selected_cols_encoded = self.encoder_.transform(selected_cols)
 
-        new_df = pd.DataFrame(selected_cols_encoded, columns=labels)
+        if self.sparse_output:
+            return join_sparse_features(remaining_cols, self.labels_, selected_cols_encoded)
+        return join_features(remaining_cols, self.labels_, selected_cols_encoded.toarray().T)
 
-        all_columns = list(remaining_cols.columns) + list(labels)
+# X as a csr matrix, for estimators that accept sparse input, the names of its columns are kept in feature_names_
+class ToSparse(StatelessMixin, BaseEstimator, TransformerMixin):
+    def fit(self, x, y=None):
+        return self
+
+    def transform(self, X, y=None):
+        matrix, self.feature_names_ = to_csr(X)
+        return matrix
 
-        return pd.DataFrame(np.c_[np.array(remaining_cols), np.array(new_df)], columns=all_columns)
+    def get_feature_names_out(self, input_features=None):
+        return np.array(self.feature_names_, dtype=object)
 
 # count vect.
 class CountVectorizer(BaseEstimator, TransformerMixin):
     def __init__(self, col):
         self.target_cols_names = col
 
-    def fit(self, x, y=None):
+    def fit(self, X, y=None):
+        self.vectorizers_ = {col: SKLCountVectorizer().fit(X[col]) for col in self.target_cols_names}
         return self
 
     def transform(self, X, y=None):
         for col in self.target_cols_names:
-            X[col] = SKLCountVectorizer().fit_transform(X[[col]])
+            X[col] = self.vectorizers_[col].transform(X[col])
 
         return X
 
 # count vect. 2
 class CountVectorizer2(BaseEstimator, TransformerMixin):
-    def __init__(self, col):
+    def __init__(self, col, sparse_output=False):
         self.target_cols_names = col
+        self.sparse_output = sparse_output
 
-    def fit(self, x, y=None):
-        return self
-
-    def transform(self, X, y=None):
-        columns_names = [[col for col in list(X.columns) if col not in self.target_cols_names]]
-        columns = np.array(X.drop(columns=self.target_cols_names))
+    # words never seen in fit are ignored
+    def fit(self, X, y=None):
+        self.vectorizers_ = []
+        self.columns_names_ = []
 
         for col in self.target_cols_names:
-            vect = SKLCountVectorizer()
-            vect_array = vect.fit_transform(X[col]).toarray()
-
-            columns = np.c_[columns, vect_array]
-            columns_names.append(list(vect.vocabulary_.keys()))
+            vect = SKLCountVectorizer().fit(X[col])
+            self.vectorizers_.append(vect)
+            self.columns_names_.extend(sorted(vect.vocabulary_, key=vect.vocabulary_.get)) # names in the matrix column order
+        return self
 
-        columns_names = np.concatenate(columns_names).ravel()
+    def transform(self, X, y=None):
+        columns_names = self.columns_names_
+        columns = [vect.transform(X[col]) for col, vect in zip(self.target_cols_names, self.vectorizers_)]
 
-        return pd.DataFrame(columns, columns=columns_names)
+        remaining_cols = X.drop(columns=self.target_cols_names)
+        if self.sparse_output:
+            return join_sparse_features(remaining_cols, columns_names, sp.sparse.hstack(columns))
+        return join_features(remaining_cols, columns_names, sp.sparse.hstack(columns).toarray().T)
 
 # input foundation date based on first price
-class InputDate(BaseEstimator, TransformerMixin):
+class InputDate(StatelessMixin, BaseEstimator, TransformerMixin):
     def __init__(self, col, ref_col):
         self.col_index = col
         self.ref_col_index = ref_col
@@ -262,275 +450,446 @@ class FillColumn(BaseEstimator, TransformerMixin):
         self.method = method
         self.const = const
 
-    def fit(self, x, y=None):
-        return self
-
-    def transform(self, X, y=None):
+    # mean and median come from the data seen in fit
+    def fit(self, X, y=None):
+        col_name = X.columns[self.col_index]
         if self.method == 'mean':
-            col_name = X.columns[self.col_index]
-            X[col_name].fillna(X[col_name].mean(), inplace=True)
+            self.fill_value_ = X[col_name].mean()
 
         elif self.method == 'const':
-            col_name = X.columns[self.col_index]
-            X[col_name].fillna(self.const, inplace=True)
+            self.fill_value_ = self.const
 
         elif self.method == 'median':
+            self.fill_value_ = X[col_name].median()
+
+        return self
+
+    def transform(self, X, y=None):
+        if self.method in ['mean', 'const', 'median']:
             col_name = X.columns[self.col_index]
-            X[col_name].fillna(X[col_name].median(), inplace=True)
+            X[col_name] = X[col_name].fillna(self.fill_value_)
 
         return X
 
+# on-disk cache of the per-fund features of ProcessPrices, keyed by a hash of the dates and prices of each fund
+# the rows of a transformer live in a folder of segment files: a run appends the series it had to compute as a new segment
+# instead of rewriting the cache, hits touch their segment and the least recently used segments of any transformer are evicted
+# once the whole cache folder would pass max_bytes
+class FeatureCache:
+    def __init__(self, folder, max_bytes=64*1024*1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._segments = {} # segment path: (keys, values) of the segments already read
+        self._indexes = {} # transformer folder: (segment paths, {key: (segment path, row)})
+        self._written = 0 # segments written by this instance, tells apart the ones named within the same clock tick
+        os.makedirs(folder, exist_ok=True)
+
+    def __getstate__(self):
+        # the segments read so far are not pickled along with a saved pipeline, they are read again from the folder
+        state = dict(vars(self))
+        state['_segments'], state['_indexes'] = {}, {}
+        return state
+
+    def _path(self, transformer):
+        # the column index only says where the series is, it does not change the features
+        params = sorted([(key, value) for key, value in vars(transformer).items() if key not in ['col_index', 'cache', 'dataset']])
+        digest = hashlib.sha1((type(transformer).__name__ + repr(params)).encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.folder, f'{ type(transformer).__name__ }-{ digest }')
+
+    def _key(self, cell):
+        # dates and values hashed as arrays, pickling lists of datetimes costs more than computing the features
+        digest = hashlib.sha1()
+        try:
+            dates = pd.DatetimeIndex(cell[0]).values.astype('datetime64[us]') # numpy converts datetime lists one by one
+            values = np.asarray(cell[1], dtype=float)
+            digest.update(np.array([len(dates), len(values)], dtype=np.int64).tobytes())
+            digest.update(dates.tobytes())
+            digest.update(values.tobytes())
+        except (TypeError, ValueError, IndexError, KeyError, pd.errors.ParserError):
+            digest.update(pickle.dumps(cell, protocol=4)) # missing series
+        return digest.hexdigest().encode("ascii")
+
+    def _index(self, path):
+        # key index of every segment of a transformer, only the segments written since the last call are read
+        names = sorted([name for name in os.listdir(path) if name.endswith('.npz')]) if os.path.isdir(path) else []
+        segments = tuple([os.path.join(path, name) for name in names])
+        if path in self._indexes and self._indexes[path][0] == segments:
+            return self._indexes[path][1]
+
+        index = {}
+        for segment in segments:
+            if segment not in self._segments:
+                try:
+                    with np.load(segment) as entries:
+                        self._segments[segment] = (entries['keys'], entries['values'])
+                except (IOError, ValueError, KeyError):
+                    continue # evicted or being written by another process
+            for row, key in enumerate(self._segments[segment][0].tolist()):
+                index[key] = (segment, row)
+
+        for segment in [segment for segment in self._segments if os.path.dirname(segment) == path and segment not in segments]:
+            del self._segments[segment]
+        self._indexes[path] = (segments, index)
+        return index
+
+    def _append(self, path, keys, values):
+        # written aside and renamed, so an interrupted run never leaves half a segment behind
+        os.makedirs(path, exist_ok=True)
+        self._written += 1
+        segment = os.path.join(path, f'{ int(time.time()*1e9) }-{ os.getpid() }-{ self._written }.npz')
+        with open(segment + ".tmp", 'wb') as tmp_file:
+            np.savez(tmp_file, keys=keys, values=values)
+        os.replace(segment + ".tmp", segment)
+        self._segments[segment] = (keys, values)
+        return segment
+
+    def _evict(self, keep):
+        folders = [os.path.join(self.folder, name) for name in os.listdir(self.folder)]
+        segments = [os.path.join(folder, name) for folder in folders if os.path.isdir(folder) for name in os.listdir(folder) if name.endswith('.npz')]
+        segments = sorted([(os.path.getmtime(segment), segment) for segment in segments], reverse=True)
+        size = 0
+        for _, segment in segments:
+            size += os.path.getsize(segment)
+            if size > self.max_bytes and segment != keep:
+                os.remove(segment)
+
+    def _compute(self, compute, cells):
+        return np.array([np.array(column, dtype=float) for column in compute(cells)]).reshape(-1, len(cells)).T
+
+    def columns(self, transformer, cells, compute):
+        # feature columns of every cell, compute(cells) only runs over the cells missing from the cache
+        cells = list(cells)
+        if len(cells) == 0:
+            return compute(cells)
+
+        path = self._path(transformer)
+        keys = [self._key(cell) for cell in cells]
+        index = self._index(path)
+        found = [index.get(key) for key in keys]
+        misses = [row for row, entry in enumerate(found) if entry is None]
+
+        width = self._segments[next(iter(index.values()))[0]][1].shape[1] if len(index) > 0 else None
+        computed = self._compute(compute, [cells[row] for row in misses]) if len(misses) > 0 else None
+        if computed is not None and width is not None and computed.shape[1] != width:
+            # the features changed since, the cached rows are dropped and every cell computed again
+            self.clear(path)
+            index, found, misses = {}, [None]*len(cells), list(range(len(cells)))
+            computed = self._compute(compute, cells)
+        width = computed.shape[1] if computed is not None else width
+
+        values = np.empty((len(cells), width))
+        hit_segments = set()
+        for row, entry in enumerate(found):
+            if entry is not None:
+                values[row] = self._segments[entry[0]][1][entry[1]]
+                hit_segments.add(entry[0])
+        for segment in hit_segments:
+            os.utime(segment) # most recently used
+
+        if len(misses) > 0:
+            values[misses] = computed
+            new_rows = {}
+            for row in misses:
+                new_rows.setdefault(keys[row], row)
+            segment = self._append(path, np.array(list(new_rows.keys()), dtype='S40'), values[list(new_rows.values())])
+            self._evict(keep=segment)
+
+        return values.T
+
+    def clear(self, path=None):
+        # every segment of one transformer folder, or of the whole cache
+        folders = [path] if path is not None else [os.path.join(self.folder, name) for name in os.listdir(self.folder)]
+        for folder in [folder for folder in folders if os.path.isdir(folder)]:
+            for filename in os.listdir(folder):
+                if filename.endswith(".npz"):
+                    os.remove(os.path.join(folder, filename))
+        self._segments = {segment: entry for segment, entry in self._segments.items() if os.path.exists(segment)}
+        self._indexes = {}
+
+# batched features of many fund histories: every series is flattened into one long array with fund ids and reduced by segments
+# inside a fund values are ordered by (date, value) descending and bucketed by ((first date - date).days)//30 months, the oldest
+# value of a bucket wins, describe-like stats follow scipy.stats.describe (ddof=1 variance, biased skewness and kurtosis)
+# a SeriesColumn is read from its arrays as they are (see from_column)
+class SeriesFeatures:
+    def __init__(self, cells, dates_of, values_of, divisor=1):
+        cells = list(cells)
+        rows = [row for row, cell in enumerate(cells) if cell is not None and len(dates_of(cell)) > 0]
+        lengths = np.array([len(dates_of(cells[row])) for row in rows], dtype=np.int64)
+        dates = np.array([date for row in rows for date in dates_of(cells[row])], dtype="datetime64[us]")
+        values = np.array([value for row in rows for value in values_of(cells[row])], dtype=float)
+        self._reduce(len(cells), np.array(rows, dtype=np.int64), lengths, dates, values/divisor)
+
+    @staticmethod
+    def from_column(column, value_column=None, divisor=1):
+        features = SeriesFeatures.__new__(SeriesFeatures)
+        lengths = column.lengths()
+        values = np.asarray(column.column(value_column), dtype=float)
+        features._reduce(len(column), np.flatnonzero(lengths > 0), lengths[lengths > 0], column.dates, values/divisor)
+        return features
+
+    def _reduce(self, n_cells, rows, lengths, dates, values):
+        # rows are the cells with a history, dates and values their histories one after the other
+        self.present = np.zeros(n_cells, dtype=bool)
+        self.present[rows] = True
+        self.filled = np.zeros((n_cells, 12), dtype=bool)
+        self.buckets = np.zeros((n_cells, 12))
+        for name in ["mean", "min", "max", "variance", "skewness", "kurtosis", "first", "last", "window_mean"]:
+            setattr(self, name, np.full(n_cells, np.nan))
+        if len(rows) == 0:
+            return
+
+        ids = np.repeat(np.arange(len(rows)), lengths)
+        dates = np.asarray(dates).astype("datetime64[us]").astype(np.int64)
+
+        order = np.lexsort((-values, -dates, ids))
+        dates, values = dates[order], values[order]
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        ends = starts + lengths
+
+        # lag buckets, the last entry of each (fund, bucket) run is the oldest one
+        month_n = (dates[starts][ids] - dates)//(86400*10**6)//30
+        window = np.flatnonzero(month_n <= 11)
+        keys = ids[window]*12 + month_n[window]
+        last = window[np.append(keys[1:] != keys[:-1], True)]
+        self.buckets[rows[ids[last]], month_n[last]] = values[last]
+        self.filled[rows[ids[last]], month_n[last]] = True
+
+        window_counts = np.bincount(ids[window], minlength=len(rows))
+        window_sums = np.bincount(ids[window], weights=values[window], minlength=len(rows))
+
+        with np.errstate(all="ignore"):
+            mean = np.add.reduceat(values, starts)/lengths
+            deviations = values - mean[ids]
+            squares = deviations*deviations
+            m2 = np.add.reduceat(squares, starts)/lengths
+            m3 = np.add.reduceat(squares*deviations, starts)/lengths
+            m4 = np.add.reduceat(squares*squares, starts)/lengths
+            zero = m2 <= (np.finfo(float).eps*mean)**2
+
+            self.mean[rows] = mean
+            self.min[rows] = np.minimum.reduceat(values, starts)
+            self.max[rows] = np.maximum.reduceat(values, starts)
+            self.variance[rows] = np.add.reduceat(squares, starts)/(lengths - 1)
+            self.skewness[rows] = np.where(zero, np.nan, m3/m2**1.5)
+            self.kurtosis[rows] = np.where(zero, np.nan, m4/m2**2 - 3)
+            self.first[rows] = values[starts]
+            self.last[rows] = values[ends - 1]
+            self.window_mean[rows] = window_sums/window_counts
+
+    def bucket_columns(self, empty=0):
+        # M-0 -> M-11 values, empty where a bucket got no value
+        return [np.where(self.filled[:, month_n], self.buckets[:, month_n], empty) for month_n in range(12)]
+
+    def relative_std(self):
+        with np.errstate(all="ignore"):
+            return np.sqrt(self.variance)/self.mean
+
 # creates columns based on dividends
-class ProcessDividends(BaseEstimator, TransformerMixin):
-    # column index
-    def __init__(self, col=17):
+class ProcessDividends(StatelessMixin, BaseEstimator, TransformerMixin):
+    new_columns_names = [f'Div. M-{ index }' for index in range(12)] + [
+        "Div. Acum. Últ. Trimestre", "Div. Média", "Div. Min", "Div. Max","Div. Desv. Pad. Rel.", "Div. Assimetria", "Div. Curtose"
+    ]
+
+    # column index, dataset is the FundsDataset of lazy frames (see FundsDataset.to_frame)
+    def __init__(self, col=17, dataset=None):
         self.col_index = col
+        self.dataset = dataset
         
     def fit(self, X, y=None):
         return self  # nothing else to do
 
-    def transform(self, X, y=None):
-        all_rows = X.iloc[:,self.col_index]
-        
-        new_columns = [[0]*len(all_rows) for _ in range(19)] # M1 -> M12 + ult. tri + mean + min + max + var + skew + kurt
-        
-        for row, series in enumerate(all_rows):                
-            if not series == None:
-                # ordenando por data
-                dates, dividends = zip(*sorted(zip(series[0], series[1]), reverse=True))
-                mean_dividends = np.mean(dividends)
-
-                if mean_dividends <= 0:
-                    mean_dividends = None
-
-                all_dividends = []
-                for index, date in enumerate(dates):              
-                    month_n = ((dates[0]-date).days)//30
-
-                    if month_n > 11: 
-                        break
-                    else:
-                        new_columns[month_n][row] = dividends[index]
-                        all_dividends.append(dividends[index])
-                
-                                              
-                new_columns[12][row] = sum([
-                    float(new_columns[0][row] or 0), float(new_columns[1][row] or 0), float(new_columns[2][row] or 0)
-                ])
-                        
-                indicators = sp.stats.describe(np.array(dividends))
-                new_columns[13][row] = mean_dividends
-                new_columns[14][row] = indicators.minmax[0]
-                new_columns[15][row] = indicators.minmax[1]
-                if mean_dividends == None or np.mean(all_dividends) <= 0:
-                    new_columns[16][row] = None
-                else:
-                    new_columns[16][row] = np.sqrt(indicators.variance)/mean_dividends
-                new_columns[17][row] = indicators.skewness
-                new_columns[18][row] = indicators.kurtosis
+    def _new_columns(self, all_rows):
+        if isinstance(all_rows, SeriesColumn):
+            features = SeriesFeatures.from_column(all_rows)
+        else:
+            features = SeriesFeatures(all_rows, lambda series: series[0], lambda series: series[1])
+
+        # M1 -> M12 + ult. tri + mean + min + max + var + skew + kurt
+        buckets = features.bucket_columns()
+        mean_dividends = np.where(features.mean <= 0, np.nan, features.mean)
+        relative_std = np.where((features.mean <= 0) | (features.window_mean <= 0), np.nan, features.relative_std())
+        new_columns = buckets + [
+            buckets[0] + buckets[1] + buckets[2], mean_dividends, features.min, features.max, relative_std, features.skewness,
+            features.kurtosis
+        ]
+        return [np.where(features.present, new_column, np.nan) for new_column in new_columns]
 
-            else:
-                for i in range(19):
-                    new_columns[i][row] = None
-              
-        return_list = X
-        for new_column in new_columns:
-            return_list = np.c_[return_list, new_column]
-
-        new_columns_names = list(X.columns)
-        new_columns_names.extend([f'Div. M-{ index }' for index in range(12)])
-        new_columns_names.extend(["Div. Acum. Últ. Trimestre", "Div. Média", "Div. Min", "Div. Max","Div. Desv. Pad. Rel.",
-        "Div. Assimetria", "Div. Curtose"])
-
-        return pd.DataFrame(np.c_[return_list], columns=new_columns_names) 
+    def transform(self, X, y=None):
+        new_columns = self._new_columns(history_column(X, self.col_index, self.dataset))
+        return join_features(X, self.new_columns_names, new_columns)
 
 # creates columns based on prices
-class ProcessPrices(BaseEstimator, TransformerMixin):
-    # column index
-    def __init__(self, col=16):
+class ProcessPrices(StatelessMixin, BaseEstimator, TransformerMixin):
+    new_columns_names = [f'Preços Média M-{ index }' for index in range(12)] + [
+        "Preços Média", "Preços Min", "Preços Max","Preços Desv. Pad. Rel.", "Preços Assimetria", "Preços Curtose",
+        "Preços Variação Total"
+    ]
+
+    # column index, cache is an optional FeatureCache (prices are the only series costing more to compute than to look up),
+    # dataset is the FundsDataset of lazy frames (see FundsDataset.to_frame)
+    def __init__(self, col=16, cache=None, dataset=None):
         self.col_index = col
+        self.cache = cache
+        self.dataset = dataset
     
-    def _filter_date(self, d_to_compare, d, month_n):
-        date_ref = d.replace(
-            year=d.year if d.month > month_n else d.year - 1,
-            month=d.month-month_n if d.month > month_n else 12-(month_n-1),
-            day=1
-        )
-        
-        return d_to_compare.month == date_ref.month and d_to_compare.year == date_ref.year
-        
+    @staticmethod
+    def _reference_month(d, month_n):
+        # year-month compared against in the month_n bucket, as months since 1970
+        # for month_n >= d.month it lands on month 13-month_n of the previous year, kept as the features were trained like that
+        year = d.year if d.month > month_n else d.year - 1
+        month = d.month-month_n if d.month > month_n else 12-(month_n-1)
+        return (year - 1970)*12 + month - 1
+
+    def _price_features(self, series):
+        # sorted once by (date, price) descending, each monthly bucket is then a contiguous block found by binary search
+        dates = np.array(series[0], dtype="datetime64[us]")
+        prices = np.array(series[1], dtype=float)
+        order = np.lexsort((prices, dates))[::-1]
+        dates, prices = dates[order], prices[order]
+
+        desc_dates = -dates.astype(np.int64)
+        desc_months = -dates.astype("datetime64[M]").astype(np.int64)
+        first_date = dates[0].astype(dt.datetime)
+
+        features = [None]*19
+        mean_price = np.mean(prices)
+        if mean_price <= 0:
+            mean_price = None
+
+        for month_n in range(12):
+            reference = -self._reference_month(first_date, month_n)
+            start = np.searchsorted(desc_months, reference, side="left")
+            end = np.searchsorted(desc_months, reference, side="right")
+
+            if start == end:
+                month_prices = [0]
+            else:
+                # the block ends at the first occurrence of its oldest date, repeated prices of that date are left out
+                last = np.searchsorted(desc_dates, desc_dates[end-1], side="left")
+                month_prices = prices[start:last+1]
+
+            mean_price_period = np.mean(month_prices)
+            if mean_price_period <= 0:
+                features[month_n] = None
+            else:
+                features[month_n] = mean_price_period
+
+        indicators = sp.stats.describe(prices)
+        features[12] = indicators.mean
+        features[13] = indicators.minmax[0]
+        features[14] = indicators.minmax[1]
+        if mean_price == None:
+            features[15] = None
+        else:
+            features[15] = np.sqrt(indicators.variance)/mean_price
+        features[16] = indicators.skewness
+        features[17] = indicators.kurtosis
+        if prices[-1] == 0:
+            features[18] = None
+        else:
+            features[18] = (float(prices[0])/float(prices[-1]))
+
+        return features
+
     def fit(self, X, y=None):
         return self  # nothing else to do
 
-    def transform(self, X, y=None):
-        all_rows = X.iloc[:,self.col_index]
-        
+    def _new_columns(self, all_rows):
         new_columns = [[0]*len(all_rows) for _ in range(19)] # (mean) M1 -> M12 + mean + 
                                                              #        min + max + var + skew + kurt + max_var_pct
         
         for row, series in enumerate(all_rows):
-            if not str(series) == "None":
-                # ordenando por data
-                dates, prices = zip(*sorted(zip(series[0], series[1]), reverse=True))
-                mean_price = np.mean(prices)
-
-                if mean_price <= 0:
-                    mean_price = None
-
-                for month_n in range(12):
-                    indexes = [dates.index(date) for date in dates if self._filter_date(date, dates[0], month_n)]  
-                    
-                    if len(indexes) == 0:
-                        month_prices = [0]
-                    else:
-                        month_prices = prices[min(indexes): max(indexes)+1]
-                    
-                    mean_price_period = np.mean(month_prices)
-                    if mean_price_period <= 0:
-                        new_columns[month_n][row] = None
-                    else:
-                        new_columns[month_n][row] = mean_price_period
-                    
-                indicators = sp.stats.describe(prices)
-                new_columns[12][row] = indicators.mean
-                new_columns[13][row] = indicators.minmax[0]
-                new_columns[14][row] = indicators.minmax[1]
-                if mean_price == None:
-                    new_columns[15][row] = None
-                else:
-                    new_columns[15][row] = np.sqrt(indicators.variance)/mean_price
-                new_columns[16][row] = indicators.skewness
-                new_columns[17][row] = indicators.kurtosis
-                if prices[-1] == 0:
-                    new_columns[18][row] = None
-                else:
-                    new_columns[18][row] = (prices[0]/prices[-1])
+            if series is not None:
+                for i, feature in enumerate(self._price_features(series)):
+                    new_columns[i][row] = feature
               
             else:
                 for i in range(19):
                     new_columns[i][row] = None
 
-        return_list = X
-        for new_column in new_columns:
-            return_list = np.c_[return_list, new_column]
-        
-        new_columns_names = list(X.columns)
-        new_columns_names.extend([f'Preços Média M-{ index }' for index in range(12)])
-        new_columns_names.extend(["Preços Média", "Preços Min", "Preços Max","Preços Desv. Pad. Rel.", "Preços Assimetria",
-        "Preços Curtose", "Preços Variação Total"])
+        return new_columns
 
-        return pd.DataFrame(np.c_[return_list], columns=new_columns_names) 
+    def transform(self, X, y=None):
+        all_rows = history_column(X, self.col_index, self.dataset)
+        if isinstance(all_rows, SeriesColumn):
+            all_rows = all_rows.views() # prices are read fund by fund, from views of the arrays
+        if self.cache is None:
+            new_columns = self._new_columns(all_rows)
+        else:
+            new_columns = self.cache.columns(self, all_rows, self._new_columns)
+        return join_features(X, self.new_columns_names, new_columns)
 
 # creates columns based on equity
-class ProcessEquity(BaseEstimator, TransformerMixin):
-    # column index
-    def __init__(self, col=19):
+class ProcessEquity(StatelessMixin, BaseEstimator, TransformerMixin):
+    # column index, dataset is the FundsDataset of lazy frames (see FundsDataset.to_frame)
+    def __init__(self, col=19, dataset=None):
         self.col_index = col
+        self.dataset = dataset
         
     def fit(self, X, y=None):
         return self  # nothing else to do
 
+    def _new_columns(self, all_rows):
+        if isinstance(all_rows, SeriesColumn):
+            features = SeriesFeatures.from_column(all_rows)
+        else:
+            features = SeriesFeatures(all_rows, lambda series: series[0], lambda series: series[1])
+
+        # M1 -> M12 + mean + min + max + var + skew + kurt + total variation
+        relative_std = np.where(features.mean == 0, 0, features.relative_std())
+        with np.errstate(all="ignore"):
+            total_variation = np.where(features.last == 0, 1, features.first/features.last)
+        new_columns = features.bucket_columns() + [
+            features.mean, features.min, features.max, relative_std, features.skewness, features.kurtosis, total_variation
+        ]
+        return [np.where(features.present, new_column, 0) for new_column in new_columns]
+
     def transform(self, X, y=None):
-        all_rows = X.iloc[:,self.col_index]
-        
-        new_columns = [[0]*len(all_rows) for _ in range(19)] # M1 -> M12 + mean + min + max + var + skew + kurt
-        
-        for row, series in enumerate(all_rows):                
-            if not series == None:
-                # ordenando por data
-                dates, equity = zip(*sorted(zip(series[0], series[1]), reverse=True))
-                mean_equity = np.mean(equity)
-
-                for index, date in enumerate(dates):              
-                    month_n = ((dates[0]-date).days)//30
-
-                    if month_n > 11: 
-                        break
-                        
-                    else:
-                        new_columns[month_n][row] = equity[index]
-                        
-                indicators = sp.stats.describe(np.array(equity))
-                new_columns[12][row] = indicators.mean
-                new_columns[13][row] = indicators.minmax[0]
-                new_columns[14][row] = indicators.minmax[1]
-                if mean_equity == 0:
-                    new_columns[15][row] = 0
-                else:
-                    new_columns[15][row] = np.sqrt(indicators.variance)/mean_equity
-                new_columns[16][row] = indicators.skewness
-                new_columns[17][row] = indicators.kurtosis
-                if equity[-1] == 0:
-                    new_columns[18][row] = 1
-                else:
-                    new_columns[18][row] = (equity[0]/equity[-1])
-              
-        return_list = X
-        for new_column in new_columns:
-            return_list = np.c_[return_list, new_column]
-        
-        new_columns_names = list(X.columns)
-        new_columns_names.extend([f'Val. Patr. M-{ index }' for index in range(12)])
+        new_columns = self._new_columns(history_column(X, self.col_index, self.dataset))
+
+        new_columns_names = [f'Val. Patr. M-{ index }' for index in range(12)]
         new_columns_names.extend(["Val. Patr. Média", "Val. Patr. Min", "Val. Patr. Max","Val. Patr. Desv. Pad. Rel.",
         "Val. Patr. Assimetria", "Val. Patr. Curtose", "Va. Patr. Variação Total"])
 
-        return pd.DataFrame(np.c_[return_list], columns=new_columns_names) 
+        return join_features(X, new_columns_names, new_columns)
 
 # creates columns based on vacancy
-class ProcessVacancy(BaseEstimator, TransformerMixin):
-    # column index
-    def __init__(self, col=20):
+class ProcessVacancy(StatelessMixin, BaseEstimator, TransformerMixin):
+    # column index, dataset is the FundsDataset of lazy frames (see FundsDataset.to_frame)
+    def __init__(self, col=20, dataset=None):
         self.col_index = col
+        self.dataset = dataset
         
     def fit(self, X, y=None):
         return self  # nothing else to do
 
+    def _new_columns(self, all_rows):
+        if isinstance(all_rows, SeriesColumn):
+            features = SeriesFeatures.from_column(all_rows, 'Vacância Física', divisor=100)
+        else:
+            features = SeriesFeatures(all_rows, lambda series: series['date'], lambda series: series['Vacância Física'], divisor=100)
+
+        # M1 -> M12 + mean + min + max + var + skew + kurt
+        relative_std = np.where(features.mean == 0, 0, features.relative_std())
+        new_columns = features.bucket_columns() + [
+            features.mean, features.min, features.max, relative_std, features.skewness, features.kurtosis
+        ]
+        return [np.where(features.present, new_column, 0) for new_column in new_columns]
+
     def transform(self, X, y=None):
-        all_rows = X.iloc[:,self.col_index]
-        
-        new_columns = [[0]*len(all_rows) for _ in range(18)] # M1 -> M12 + mean + min + max + var + skew + kurt
-        
-        for row, series in enumerate(all_rows):                
-            if not series == None:
-                # ordenando por data
-                dates_unsorted = series['date']
-                vacancy_unsorted = [vacancy/100 for vacancy in series['Vacância Física']]
-                dates, vacancy = zip(*sorted(zip(dates_unsorted, vacancy_unsorted), reverse=True))
-                mean_vacancy = np.mean(vacancy)
-
-                for index, date in enumerate(dates):              
-                    month_n = ((dates[0]-date).days)//30
-
-                    if month_n > 11: 
-                        break
-                        
-                    else:
-                        new_columns[month_n][row] = vacancy[index]
-                        
-                indicators = sp.stats.describe(np.array(vacancy))
-                new_columns[12][row] = indicators.mean
-                new_columns[13][row] = indicators.minmax[0]
-                new_columns[14][row] = indicators.minmax[1]
-                if mean_vacancy == 0:
-                    new_columns[15][row] = 0
-                else:
-                    new_columns[15][row] = np.sqrt(indicators.variance)/mean_vacancy
-                new_columns[16][row] = indicators.skewness
-                new_columns[17][row] = indicators.kurtosis
-              
-        return_list = X
-        for new_column in new_columns:
-            return_list = np.c_[return_list, new_column]
-        
-        new_columns_names = list(X.columns)
-        new_columns_names.extend([f'Vacância M-{ index }' for index in range(12)])
+        new_columns = self._new_columns(history_column(X, self.col_index, self.dataset))
+
+        new_columns_names = [f'Vacância M-{ index }' for index in range(12)]
         new_columns_names.extend(["Vacância Média", "Vacância Min", "Vacância Max","Vacância Desv. Pad. Rel.",
         "Vacância Assimetria", "Vacância Curtose"])
 
-        return pd.DataFrame(np.c_[return_list], columns=new_columns_names)
+        return join_features(X, new_columns_names, new_columns)
 
 # creates columns based on assets
-class ProcessAssets(BaseEstimator, TransformerMixin):
+class ProcessAssets(StatelessMixin, BaseEstimator, TransformerMixin):
+    ufs = ['AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG',
+           'PA', 'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO']
+
     # column index
     def __init__(self, col=13):
         self.col_index = col
@@ -538,28 +897,265 @@ class ProcessAssets(BaseEstimator, TransformerMixin):
     def fit(self, X, y=None):
         return self  # nothing else to do
 
-    def transform(self, X, y=None):
-        all_rows = X.iloc[:,self.col_index]
-        
-        ufs = ['AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG', 
-               'PA', 'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO']
-        new_columns = [[np.zeros(len(ufs)) for __ in range(len(all_rows))] for _ in range(1)] # assets location
+    def _new_columns(self, all_rows):
+        new_columns = np.zeros((len(all_rows), len(self.ufs))) # assets location
 
         for row, series in enumerate(all_rows):                
             if not series == None:
                 assets_loc_uf = series['Location'][0]
                 assets_area_uf = series['Location'][1]
                 
-                for uf_index, uf in enumerate(ufs):
+                for uf_index, uf in enumerate(self.ufs):
                     if (uf in assets_loc_uf):
                         index = assets_loc_uf.index(uf)
-                        new_columns[0][row][uf_index] = assets_area_uf[index]
+                        new_columns[row, uf_index] = assets_area_uf[index]
 
-        return_list = X
-        for new_column in new_columns:
-            return_list = np.c_[return_list, new_column]
-        
-        new_columns_names = list(X.columns)
-        new_columns_names.extend([f"Área dos Ativos { uf }" for uf in ufs])
+        return new_columns.T
+
+    def transform(self, X, y=None):
+        new_columns = self._new_columns(X.iloc[:,self.col_index])
+
+        new_columns_names = [f"Área dos Ativos { uf }" for uf in self.ufs]
+
+        return join_features(X, new_columns_names, new_columns)        
+
+# count, mean, central moment sums, min and max of a stream of values, each batch is merged in with Pébay's pairwise formulas
+class RunningMoments:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+
+        count_b = len(values)
+        mean_b = values.mean()
+        deviations = values - mean_b
+        m2_b = np.sum(deviations**2)
+        m3_b = np.sum(deviations**3)
+        m4_b = np.sum(deviations**4)
+
+        count_a, mean_a, m2_a, m3_a = self.count, self.mean, self.m2, self.m3
+        count = count_a + count_b
+        delta = mean_b - mean_a
+
+        self.mean = mean_a + delta*count_b/count
+        self.m4 = (self.m4 + m4_b + delta**4*count_a*count_b*(count_a**2 - count_a*count_b + count_b**2)/count**3
+                   + 6*delta**2*(count_a**2*m2_b + count_b**2*m2_a)/count**2 + 4*delta*(count_a*m3_b - count_b*m3_a)/count)
+        self.m3 = m3_a + m3_b + delta**3*count_a*count_b*(count_a - count_b)/count**2 + 3*delta*(count_a*m2_b - count_b*m2_a)/count
+        self.m2 = m2_a + m2_b + delta**2*count_a*count_b/count
+        self.count = count
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    # same conventions as scipy.stats.describe: ddof=1 variance, biased skewness and kurtosis, nan for constant values
+    def variance(self):
+        return self.m2/(self.count - 1) if self.count > 1 else np.nan
+
+    def _constant(self):
+        return self.m2/self.count <= (np.finfo(float).eps*self.mean)**2
+
+    def skewness(self):
+        if self.count == 0 or self._constant():
+            return np.nan
+        return (self.m3/self.count)/(self.m2/self.count)**1.5
+
+    def kurtosis(self):
+        if self.count == 0 or self._constant():
+            return np.nan
+        return (self.m4/self.count)/(self.m2/self.count)**2 - 3
+
+# running aggregates of one fund history, dates as microseconds since 1970
+# newest and oldest keep the value the sorted (date, value) descending order puts first and last
+class SeriesHistory:
+    day = 86400*10**6
+
+    def __init__(self):
+        self.moments = RunningMoments()
+        self.newest = None
+        self.newest_value = None
+        self.oldest = None
+        self.oldest_value = None
+
+    def update(self, dates, values):
+        dates = np.asarray(dates, dtype="datetime64[us]").astype(np.int64)
+        values = np.asarray(values, dtype=float)
+        if len(dates) == 0:
+            return
+
+        self.moments.update(values)
+        newest, oldest = dates.max(), dates.min()
+        newest_value, oldest_value = values[dates == newest].max(), values[dates == oldest].min()
+        if self.newest is None or newest > self.newest:
+            self.newest, self.newest_value = newest, newest_value
+        elif newest == self.newest:
+            self.newest_value = max(self.newest_value, newest_value)
+        if self.oldest is None or oldest < self.oldest:
+            self.oldest, self.oldest_value = oldest, oldest_value
+        elif oldest == self.oldest:
+            self.oldest_value = min(self.oldest_value, oldest_value)
+
+        self._add_points(dates, values)
+
+    def sync(self, series):
+        # feeds the points of a full scraped history that are newer than the newest one already seen
+        if series is None or len(series[0]) == 0:
+            return
+        dates = np.array(series[0], dtype="datetime64[us]").astype(np.int64)
+        new = dates > self.newest if self.newest is not None else np.ones(len(dates), dtype=bool)
+        self.update(dates[new], np.array(series[1], dtype=float)[new])
+
+# ProcessDividends features of one fund, only the points of the last 12 buckets (30 days each) are kept around
+class DividendHistory(SeriesHistory):
+    def __init__(self):
+        super().__init__()
+        self.window_dates = np.empty(0, dtype=np.int64)
+        self.window_values = np.empty(0)
+
+    def _add_points(self, dates, values):
+        dates = np.concatenate([self.window_dates, dates])
+        values = np.concatenate([self.window_values, values])
+        keep = (self.newest - dates)//self.day//30 <= 11
+        self.window_dates, self.window_values = dates[keep], values[keep]
+
+    def features(self):
+        if self.newest is None:
+            return [np.nan]*19
+
+        # the oldest point of each bucket wins, the smallest value between points of the same date
+        buckets = [0.0]*12
+        month_n = (self.newest - self.window_dates)//self.day//30
+        for index in np.lexsort((-self.window_values, -self.window_dates)):
+            buckets[month_n[index]] = self.window_values[index]
+
+        moments = self.moments
+        window_mean = self.window_values.mean()
+        mean_dividends = np.nan if moments.mean <= 0 else moments.mean
+        if moments.mean <= 0 or window_mean <= 0:
+            relative_std = np.nan
+        else:
+            relative_std = np.sqrt(moments.variance())/moments.mean
+
+        return buckets + [
+            buckets[0] + buckets[1] + buckets[2], mean_dividends, moments.min, moments.max, relative_std,
+            moments.skewness(), moments.kurtosis()
+        ]
+
+# ProcessPrices features of one fund from monthly sums and counts, months older than two years can no longer be a bucket
+# and are dropped, within a month the prices repeated on its oldest date only count once with the highest one
+class PriceHistory(SeriesHistory):
+    months_kept = 24
+
+    def __init__(self):
+        super().__init__()
+        self.months = {} # month -> [sum, count, oldest date, oldest date sum, oldest date count, oldest date max]
+
+    def _add_points(self, dates, values):
+        months = dates.astype("datetime64[us]").astype("datetime64[M]").astype(np.int64)
+        first_month = self.newest.astype("datetime64[us]").astype("datetime64[M]").astype(np.int64) - self.months_kept
+
+        for date, month, value in zip(dates.tolist(), months.tolist(), values.tolist()):
+            if month < first_month:
+                continue
+            aggregate = self.months.get(month)
+            if aggregate is None:
+                self.months[month] = [value, 1, date, value, 1, value]
+                continue
+
+            aggregate[0] += value
+            aggregate[1] += 1
+            if date < aggregate[2]:
+                aggregate[2:] = [date, value, 1, value]
+            elif date == aggregate[2]:
+                aggregate[3] += value
+                aggregate[4] += 1
+                aggregate[5] = max(aggregate[5], value)
+
+        for month in [month for month in self.months if month < first_month]:
+            del self.months[month]
+
+    def features(self):
+        if self.newest is None:
+            return [np.nan]*19
+
+        newest_month = int(self.newest.astype("datetime64[us]").astype("datetime64[M]").astype(np.int64))
+        first_date = dt.date(1970 + newest_month//12, newest_month%12 + 1, 1)
+
+        features = [np.nan]*19
+        for month_n in range(12):
+            aggregate = self.months.get(ProcessPrices._reference_month(first_date, month_n))
+            if aggregate is not None:
+                mean_price_period = (aggregate[0] - aggregate[3] + aggregate[5])/(aggregate[1] - aggregate[4] + 1)
+                if mean_price_period > 0:
+                    features[month_n] = mean_price_period
+
+        moments = self.moments
+        features[12] = moments.mean
+        features[13] = moments.min
+        features[14] = moments.max
+        if moments.mean > 0:
+            features[15] = np.sqrt(moments.variance())/moments.mean
+        features[16] = moments.skewness()
+        features[17] = moments.kurtosis()
+        if self.oldest_value != 0:
+            features[18] = self.newest_value/self.oldest_value
+
+        return features
+
+# Process* features kept up to date between runs: every fund (by ticker) holds running aggregates and each transform only
+# feeds the points newer than the ones already seen, so a daily run costs O(new points) per fund instead of its whole history
+# the histories are learned in fit (histories_) and every later transform keeps them up to date
+class IncrementalSeries(BaseEstimator, TransformerMixin):
+    def __init__(self, col, ticker_col='Ticker'):
+        self.col_index = col
+        self.ticker_col = ticker_col
+
+    def _sync(self, X):
+        new_rows = []
+        for ticker, series in zip(X[self.ticker_col], X.iloc[:,self.col_index]):
+            if ticker not in self.histories_:
+                self.histories_[ticker] = self.history_class()
+            self.histories_[ticker].sync(series)
+            new_rows.append(self.histories_[ticker].features())
+
+        return np.array(new_rows, dtype=float).reshape(-1, 19).T
+
+    def fit(self, X, y=None):
+        self.histories_ = {}
+        self._sync(X)
+        return self
+
+    def fit_transform(self, X, y=None):
+        self.histories_ = {}
+        return self.transform(X)
+
+    def transform(self, X, y=None):
+        return join_features(X, self.new_columns_names, self._sync(X))
+
+class IncrementalDividends(IncrementalSeries):
+    history_class = DividendHistory
+    new_columns_names = ProcessDividends.new_columns_names
+
+    def __init__(self, col=17, ticker_col='Ticker'):
+        super().__init__(col, ticker_col)
+
+class IncrementalPrices(IncrementalSeries):
+    history_class = PriceHistory
+    new_columns_names = ProcessPrices.new_columns_names
+
+    def __init__(self, col=16, ticker_col='Ticker'):
+        super().__init__(col, ticker_col)
+
+# saves a fitted pipeline, new funds can then be scored with transforms only
+def save_pipeline(pipeline, path):
+    joblib.dump(pipeline, path)
 
-        return pd.DataFrame(np.c_[return_list], columns=new_columns_names)        
\ No newline at end of file
+def load_pipeline(path):
+    return joblib.load(path)